@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""Benchmarks for the Magic Frame image pipeline.
+
+Runs headless, every measurement happens in a fresh child process so peak RSS
+figures do not leak between runs.
+
+Usage:
+    python3 benchmark.py corpus /tmp/corpus
+    python3 benchmark.py decode /tmp/corpus --width 1024 --height 600 --repeat 3
+    python3 benchmark.py sync /tmp/corpus --mode zip --json results.json
+"""
+import os
+import sys
+import io
+import re
+import json
+import time
+import random
+import zipfile
+import hashlib
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ProcessPoolExecutor
+
+import PIL
+from PIL import Image
+
+from loginscript import (prepare_image, SUPPORTED_FORMATS, MagicFrameApp, ApiClient, LibraryIndex,
+                         PhotoStore, SyncClient, StorageManager)
+
+SYNC_MODES = ('json', 'zip', 'single', 'sync')
+
+# (width, height, EXIF orientation, format) of the generated corpus
+CORPUS = (
+    [(4032, 3024, orientation, 'JPEG') for orientation in range(1, 9)] +
+    [(6000, 4000, 1, 'JPEG'), (3024, 4032, 1, 'JPEG'), (1920, 1080, 1, 'JPEG'), (640, 480, 6, 'JPEG'),
+     (2000, 1500, None, 'PNG'), (800, 600, None, 'PNG'), (1280, 720, None, 'GIF')]
+)
+
+
+def find_images(directory):
+    images = []
+    for filename in sorted(os.listdir(directory)):
+        if os.path.splitext(filename)[1].lower() in SUPPORTED_FORMATS:
+            images.append(os.path.join(directory, filename))
+    return images
+
+
+def percentiles(values):
+    """Summary of a list of seconds in milliseconds"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+
+    def rank(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': round(rank(0.50), 2),
+        'p90_ms': round(rank(0.90), 2),
+        'p99_ms': round(rank(0.99), 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def environment():
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'pillow': PIL.__version__,
+    }
+
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def write_json(results, destination):
+    if destination == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    elif destination:
+        with open(destination, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {destination}")
+
+
+def print_stages(label, result):
+    for stage, summary in result['stages'].items():
+        if summary['count']:
+            print(f"{label:<10}{stage:<10}{summary['count']:>7}{summary['mean_ms']:>10.1f}{summary['p50_ms']:>10.1f}"
+                  f"{summary['p90_ms']:>10.1f}{summary['p99_ms']:>10.1f}{summary['max_ms']:>10.1f}")
+
+
+def print_stage_header():
+    print(f"{'run':<10}{'stage':<10}{'count':>7}{'mean ms':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+
+
+# Corpus
+
+def texture(rng, size, mode='RGB'):
+    """Smooth random picture, deterministic for a seeded rng and compressing like a photo"""
+    bands = [Image.frombytes('L', (48, 36), rng.randbytes(48 * 36)).resize(size, Image.BICUBIC)
+             for _ in range(len(mode))]
+    return Image.merge(mode, bands)
+
+
+def generate_corpus(args):
+    os.makedirs(args.directory, exist_ok=True)
+    rng = random.Random(args.seed)
+    for index, (width, height, orientation, image_format) in enumerate(CORPUS):
+        if image_format == 'JPEG':
+            path = os.path.join(args.directory, f"{index:02d}_{width}x{height}_o{orientation}.jpg")
+            exif = Image.Exif()
+            exif[0x0112] = orientation
+            texture(rng, (width, height)).save(path, 'JPEG', quality=90, exif=exif)
+        elif image_format == 'PNG':
+            path = os.path.join(args.directory, f"{index:02d}_{width}x{height}.png")
+            texture(rng, (width, height), 'RGBA').save(path, 'PNG')
+        else:
+            path = os.path.join(args.directory, f"{index:02d}_{width}x{height}.gif")
+            frames = [texture(rng, (width, height)).convert('P') for _ in range(3)]
+            frames[0].save(path, 'GIF', save_all=True, append_images=frames[1:], duration=500, loop=0)
+        print(f"{path} ({os.path.getsize(path) // 1024} KB)")
+    return 0
+
+
+# Decode pipeline
+
+def run_decode(image_paths, width, height, repeat, reduced_decode):
+    """Prepare every image like show_next_image does and return per-stage timings"""
+    stages = {}
+    totals = []
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for image_path in image_paths:
+            timings = {}
+            image_start = time.perf_counter()
+            prepare_image(image_path, width, height, reduced_decode=reduced_decode, timings=timings)
+            totals.append(time.perf_counter() - image_start)
+            for stage, seconds in timings.items():
+                stages.setdefault(stage, []).append(seconds)
+    elapsed = time.perf_counter() - start
+
+    summary = {stage: percentiles(values) for stage, values in stages.items()}
+    summary['total'] = percentiles(totals)
+    return {
+        'stages': summary,
+        'images_per_s': round(len(totals) / elapsed, 2),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def benchmark_decode(args):
+    image_paths = find_images(args.directory)
+    if not image_paths:
+        print(f"No images found in {args.directory}")
+        return 1
+
+    print(f"Preparing {len(image_paths)} images for {args.width}x{args.height}, {args.repeat} pass(es)")
+    results = {'benchmark': 'decode', 'environment': environment(), 'images': len(image_paths),
+               'repeat': args.repeat, 'screen': [args.width, args.height], 'runs': {}}
+    print_stage_header()
+    for label, reduced_decode in (('full', False), ('reduced', True)):
+        # A fresh process per mode so the peak RSS of one run does not hide the other
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(
+                run_decode, image_paths, args.width, args.height, args.repeat, reduced_decode).result()
+        results['runs'][label] = result
+        print_stages(label, result)
+        print(f"{label:<10}{result['images_per_s']:.1f} images/s, peak RSS {result['peak_rss_mb']:.1f} MB")
+
+    write_json(results, args.json)
+    return 0
+
+
+# Sync paths
+
+class StandInServer(BaseHTTPRequestHandler):
+    """Serves the corpus through the same endpoints as website/api.php.
+    json, zip and single answer notDownloadedImages like the legacy server, sync serves the
+    acknowledged pendingImages/ackImages protocol. POST /benchmark/reset marks everything
+    as not downloaded again."""
+    protocol_version = 'HTTP/1.1'
+    mode = 'json'
+    files = {}  # id -> (name, bytes)
+    archive = b''
+    pending = set()
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, content_type, status=200, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        self.send_body(json.dumps(data).encode(), 'application/json', status)
+
+    def take_pending(self, count=None):
+        with self.lock:
+            ids = sorted(self.pending)[:count]
+            self.pending.difference_update(ids)
+        return ids
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        query = dict(re.findall(r'[?&]([^=&]+)=([^&]*)', self.path))
+        if path.startswith('/uploads/'):
+            name = os.path.basename(path)
+            for file_name, data in self.files.values():
+                if file_name == name:
+                    return self.send_body(data, 'application/octet-stream')
+            return self.send_json({'error': 'Not found'}, 404)
+
+        endpoint = path.rsplit('/', 1)[-1]
+        if endpoint == 'pendingImages' and self.mode == 'sync':
+            after = int(query.get('after', 0))
+            limit = int(query.get('limit', 20))
+            with self.lock:
+                ids = sorted(i for i in self.pending if i > after)[:limit]
+            images = [{'id': i, 'url': f"uploads/{self.files[i][0]}", 'original_filename': self.files[i][0],
+                       'size': len(self.files[i][1]), 'sha256': hashlib.sha256(self.files[i][1]).hexdigest()}
+                      for i in ids]
+            return self.send_json({'images': images})
+
+        if endpoint == 'notDownloadedImages' and self.mode != 'sync':
+            if self.mode == 'zip':
+                if not self.take_pending():
+                    return self.send_json({'message': 'No new images'})
+                return self.send_body(self.archive, 'application/zip',
+                                      headers={'Content-Disposition': 'attachment; filename="images.zip"'})
+            if self.mode == 'single':
+                ids = self.take_pending(1)
+                if not ids:
+                    return self.send_json({'message': 'No new images'})
+                name, data = self.files[ids[0]]
+                content_type = Image.MIME.get(Image.registered_extensions()[os.path.splitext(name)[1]])
+                return self.send_body(data, content_type,
+                                      headers={'Content-Disposition': f'attachment; filename="{name}"'})
+            ids = self.take_pending()
+            if not ids:
+                return self.send_json({'message': 'No new images'})
+            return self.send_json({'images': [{'id': i, 'url': f"uploads/{self.files[i][0]}",
+                                               'original_filename': self.files[i][0]} for i in ids]})
+
+        self.send_json({'error': 'Endpoint not found'}, 404)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.path.endswith('/ackImages'):
+            ids = json.loads(body).get('ids', [])
+            with self.lock:
+                self.pending.difference_update(ids)
+            return self.send_json({'success': True})
+        if self.path == '/benchmark/reset':
+            with self.lock:
+                self.pending.update(self.files)
+            return self.send_json({'success': True})
+        self.send_json({'error': 'Endpoint not found'}, 404)
+
+
+def start_server(image_paths, mode):
+    files = {}
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for image_id, image_path in enumerate(image_paths, 1):
+            with open(image_path, 'rb') as f:
+                files[image_id] = (os.path.basename(image_path), f.read())
+            zip_file.writestr(os.path.basename(image_path), files[image_id][1])
+
+    handler = type('Handler', (StandInServer,), {
+        'mode': mode, 'files': files, 'archive': archive.getvalue(), 'pending': set(), 'lock': threading.Lock()})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class HeadlessSync(MagicFrameApp):
+    """The app's sync code paths without a window, storing into a scratch directory"""
+    def __init__(self, base_url, directory):
+        self.is_online_mode = True
+        self.token = 'benchmark'
+        self.display_size = (1024, 600)
+        self.api = ApiClient(lambda: self.token, base_url=base_url)
+        self.library = LibraryIndex(directory, os.path.join(directory, '.library.db'))
+        self.store = PhotoStore(self.library, directory)
+        self.sync_client = SyncClient(self.api, self.store, self.display_size,
+                                      state_file=os.path.join(directory, '.sync_state.json'))
+        self.storage = StorageManager(self.library, self.store, self.display_size,
+                                      self.sync_client.fetch_original, budget=None, min_free=0)
+
+    def run_on_ui_thread(self, func, *args):
+        pass
+
+
+def run_sync(base_url, mode, image_count, repeat):
+    """Download the whole corpus repeat times through check_for_new_images"""
+    requests_seconds = []
+    runs = []
+    received = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            app = HeadlessSync(base_url, directory)
+            app.api.post(f"{base_url}/benchmark/reset")
+            app.api.session.hooks['response'].append(
+                lambda response, *args, **kwargs: requests_seconds.append(response.elapsed.total_seconds()))
+
+            start = time.perf_counter()
+            downloaded = 0
+            while downloaded < image_count:
+                new_images = app.check_for_new_images()
+                if not new_images:
+                    break
+                downloaded += new_images
+            runs.append(time.perf_counter() - start)
+            received += app.api.bytes_received
+            if downloaded != image_count:
+                print(f"Only {downloaded} of {image_count} images arrived")
+
+    elapsed = sum(runs)
+    return {
+        'stages': {'request': percentiles(requests_seconds), 'run': percentiles(runs)},
+        'images_per_s': round(image_count * repeat / elapsed, 2),
+        'mb_per_s': round(received / elapsed / (1024 * 1024), 2),
+        'bytes_received': received,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def benchmark_sync(args):
+    image_paths = find_images(args.directory)
+    if not image_paths:
+        print(f"No images found in {args.directory}")
+        return 1
+
+    modes = SYNC_MODES if args.mode == 'all' else (args.mode,)
+    results = {'benchmark': 'sync', 'environment': environment(), 'images': len(image_paths),
+               'repeat': args.repeat, 'runs': {}}
+    print(f"Downloading {len(image_paths)} images from a local stand-in server, {args.repeat} pass(es)")
+    print_stage_header()
+    for mode in modes:
+        server = start_server(image_paths, mode)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = executor.submit(run_sync, base_url, mode, len(image_paths), args.repeat).result()
+        finally:
+            server.shutdown()
+        results['runs'][mode] = result
+        print_stages(mode, result)
+        print(f"{mode:<10}{result['images_per_s']:.1f} images/s, {result['mb_per_s']:.1f} MB/s, "
+              f"peak RSS {result['peak_rss_mb']:.1f} MB")
+
+    write_json(results, args.json)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Magic Frame benchmarks")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    corpus_parser = subparsers.add_parser('corpus', help="generate a test corpus of JPEG, PNG and GIF images")
+    corpus_parser.add_argument('directory', help="directory to write the images to")
+    corpus_parser.add_argument('--seed', type=int, default=1, help="seed for the image contents")
+    corpus_parser.set_defaults(func=generate_corpus)
+
+    decode_parser = subparsers.add_parser('decode', help="per-stage decode time and peak memory, full vs reduced decoding")
+    decode_parser.add_argument('directory', help="directory of images to prepare")
+    decode_parser.add_argument('--width', type=int, default=1024, help="screen width")
+    decode_parser.add_argument('--height', type=int, default=600, help="screen height")
+    decode_parser.add_argument('--repeat', type=int, default=1, help="passes over the directory")
+    decode_parser.add_argument('--json', help="write machine-readable results to this file, - for stdout")
+    decode_parser.set_defaults(func=benchmark_decode)
+
+    sync_parser = subparsers.add_parser('sync', help="download paths of check_for_new_images against a local server")
+    sync_parser.add_argument('directory', help="directory of images the server offers")
+    sync_parser.add_argument('--mode', choices=SYNC_MODES + ('all',), default='all',
+                             help="server response to exercise: JSON metadata, ZIP, single images or the sync protocol")
+    sync_parser.add_argument('--repeat', type=int, default=1, help="downloads of the whole directory")
+    sync_parser.add_argument('--json', help="write machine-readable results to this file, - for stdout")
+    sync_parser.set_defaults(func=benchmark_sync)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,14 +4,12 @@ import sys
 import time
 import random
 import json
-import requests
 import threading
 import subprocess
-from datetime import datetime
+from datetime import datetime, timedelta
 import tkinter as tk
 from tkinter import ttk, simpledialog
 from PIL import Image, ImageTk, ImageOps, ExifTags
-import pygame
 
 import tempfile
 import zipfile
@@ -19,21 +17,2218 @@ import shutil
 import re
 import mimetypes
 import time
+import hashlib
+import sqlite3
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import zlib
+import mmap
+import bisect
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 # Server API configuration
 SERVER_BASE_URL = "https://magicframe.site/website"
 API_URL = f"{SERVER_BASE_URL}/api.php"
+API_CONNECT_TIMEOUT = 5  # seconds to establish a connection
+API_READ_TIMEOUT = 30  # seconds without data before a request is abandoned
+API_RETRIES = 3  # retries for failed connections and 5xx responses
+API_BACKOFF = 0.5  # retry delays grow as 0.5s, 1s, 2s, ...
+API_POOL_SIZE = 4  # keep-alive connections kept open to the server
+DOWNLOAD_WORKERS = 4  # parallel image downloads, should not exceed API_POOL_SIZE
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
 # Local settings                                                                
 IMAGE_DIR = os.path.expanduser("~/slideshow_images")
 CONFIG_FILE = os.path.expanduser("~/magicframe_config.json")
 SUPPORTED_FORMATS = ['.jpg', '.jpeg', '.png', '.gif']
 SLIDESHOW_DELAY = 10  # seconds between images
-CHECK_NEW_IMAGES_INTERVAL = 300  # check for new images every 5 minutes
+SYNC_MIN_INTERVAL = 60  # poll this often right after new images arrived
+SYNC_MAX_INTERVAL = 3600  # idle frames back off to one poll an hour
+SYNC_QUIET_HOURS = (23, 6)  # (start, end) hours without scheduled polls, None to poll around the clock
+SYNC_HOURLY_BYTE_CAP = 200 * 1024 * 1024  # bytes downloaded per hour before polls pause, None for no cap
+NOTIFY_ENABLED = True  # keep a waitForImages long-poll open so new shares sync right away
+NOTIFY_WAIT = 25  # seconds the server holds a long-poll open, below typical proxy timeouts
+NOTIFY_RETRY_DELAY = 30  # seconds before reconnecting after a failed long-poll
+PREFETCH_COUNT = 3  # number of upcoming images prepared in the background
+PREFETCH_WORKERS = 2  # worker threads decoding and resizing images
+PREFETCH_POLL_INTERVAL = 50  # ms to wait before checking again for an unfinished image
+CACHE_DIR = os.path.expanduser("~/.magicframe_cache")
+LIBRARY_DB = os.path.join(CACHE_DIR, "library.db")
+SYNC_STATE_FILE = os.path.join(CACHE_DIR, "sync_state.json")
+SYNC_PAGE_SIZE = 20  # images listed per pendingImages request, the server may render each one
+SYNC_RENDITIONS = True  # ask the server for copies sized for this display instead of originals
+RENDITION_FORMAT = "jpeg"
+RENDER_CACHE_DIR = os.path.join(CACHE_DIR, "renders")
+RENDER_CACHE_MAX_BYTES = 256 * 1024 * 1024  # screen-sized copies kept on the SD card
+RENDER_CACHE_JPEG_QUALITY = 90
+REDUCED_DECODE = True  # decode large JPEGs at reduced scale before the final resize
+FRAME_CACHE_MAX_BYTES = 128 * 1024 * 1024  # display-ready frames kept in RAM (~50 frames at 1024x600)
+FRAME_CACHE_MIN_AVAILABLE = 150 * 1024 * 1024  # drop cached frames when free RAM falls below this
+WATCH_DEBOUNCE = 2  # seconds a new file must stay untouched before it is shown
+WATCH_POLL_INTERVAL = 10  # seconds between directory scans when inotify is unavailable
+UI_QUEUE_POLL_INTERVAL = 200  # ms between checks for results from background threads
+RENDERER = "tk"  # "tk" or "pygame", pygame presents frames through SDL (KMS/DRM on the Pi)
+PYGAME_VIDEO_DRIVERS = ("kmsdrm", "x11", "wayland")  # tried in order, add "offscreen" to test without a display
+PYGAME_EVENT_POLL_INTERVAL = 50  # ms between checks for taps and key presses
+TRANSITION = "crossfade"  # "cut", "crossfade" or "kenburns" (crossfade into a slow zoom-out)
+TRANSITION_DURATION = 1.0  # seconds
+TRANSITION_FPS = 20  # target frame rate of transitions
+TRANSITION_LATE_FRAMES = 2  # frames a transition may fall behind before it is cut short
+TRANSITION_POLL_INTERVAL = 250  # ms to wait for the next image before building its transition
+KEN_BURNS_ZOOM = 0.08  # extra zoom at the start of a Ken Burns transition
+FRAME_STORE = False  # keep screen-ready frames as raw RGB in a memory-mapped file, for large libraries
+FRAME_STORE_FILE = os.path.join(CACHE_DIR, "frames.raw")
+FRAME_STORE_SLOTS = 200  # frames kept in the file, each takes width*height*3 bytes (~1.8 MB at 1024x600)
+PLAYBACK_NO_REPEAT = 50  # slides before an image can be shown again, capped by the library size
+PLAYBACK_RECENT_DAYS = 7  # images added this recently are shown more often
+PLAYBACK_RECENT_SHARE = 0.3  # share of slides drawn from recent images while there are any
+PLAYBACK_ANNIVERSARY_DAYS = 3  # photos taken this close to today's date in earlier years count as recent, 0 for off
+STORAGE_BUDGET_BYTES = 8 * 1024 * 1024 * 1024  # space photos may take in IMAGE_DIR, None for no limit
+STORAGE_MIN_FREE_BYTES = 1024 * 1024 * 1024  # always leave this much free on the SD card
+STORAGE_SHRINK_TARGET = 0.9  # once over budget, shrink originals until usage is below this share
+STORAGE_RESTORE_BELOW = 0.7  # re-download shrunk originals while usage stays below this share
+STORAGE_KEEP_UNRECOVERABLE = True  # never shrink originals that cannot be downloaded again
+STORAGE_RENDITION_QUALITY = 90
+FAST_START = True  # with a saved login, go straight to the slideshow and show the last photo first
+LAST_SHOWN_FILE = os.path.join(CACHE_DIR, "last_shown.json")
+LAST_SHOWN_SAVE_INTERVAL = 60  # seconds between saves of the photo on screen, limits SD card writes
+STARTUP_LOG_FILE = os.path.join(CACHE_DIR, "startup.jsonl")
+STARTUP_LOG_KEEP = 50  # startup timelines kept in the log
+ZIP_STREAMING = True  # extract ZIP downloads while they arrive instead of via a temporary file
+ZIP_CHUNK_SIZE = 64 * 1024
+METRICS_ENABLED = False  # time pipeline stages into histograms, costs next to nothing when off
+METRICS_PORT = 9464  # serve them in Prometheus text format on http://127.0.0.1:9464/metrics, None for no endpoint
+METRICS_STATS_FILE = os.path.join(CACHE_DIR, "stats.jsonl")
+METRICS_STATS_INTERVAL = 300  # seconds between snapshots appended to the stats file
+METRICS_STATS_MAX_BYTES = 1024 * 1024  # stats file size before it is rotated
+METRICS_STATS_BACKUPS = 3  # rotated stats files kept next to it
+METRICS_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+METRICS_RATE_BUCKETS = tuple(2 ** n * 1024 for n in range(6, 16))  # bytes/s, 64 KB/s to 32 MB/s
+
+MODULE_LOADED = time.monotonic()
 
 # Ensure image directory exists
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
+def fit_to_screen(img_width, img_height, screen_width, screen_height):
+    """Return the largest size with the image's aspect ratio that fits on the screen"""
+    aspect_ratio = img_width / img_height
+
+    if screen_width / screen_height > aspect_ratio:
+        # Screen is wider than image
+        new_height = screen_height
+        new_width = int(aspect_ratio * new_height)
+    else:
+        # Screen is taller than image
+        new_width = screen_width
+        new_height = int(new_width / aspect_ratio)
+
+    return max(new_width, 1), max(new_height, 1)
+
+# Transpose that undoes each EXIF orientation, 1 and unknown values need none
+ORIENTATION_TRANSPOSE = {
+    2: Image.FLIP_LEFT_RIGHT,
+    3: Image.ROTATE_180,
+    4: Image.FLIP_TOP_BOTTOM,
+    5: Image.TRANSPOSE,
+    6: Image.ROTATE_270,
+    7: Image.TRANSVERSE,
+    8: Image.ROTATE_90,
+}
+
+def read_exif(image):
+    """Return (orientation, capture time as a timestamp or None) of an opened image.
+    Only the metadata in the file header is parsed, no pixel data is decoded."""
+    if 'exif' not in image.info:
+        # JPEG EXIF is read on open. Pillow would decode a PNG to look for an eXIf chunk
+        # after the pixel data, so such late chunks are ignored.
+        return 1, None
+    exif = image.getexif()
+    orientation = exif.get(ExifTags.Base.Orientation, 1)
+    taken = exif.get_ifd(ExifTags.IFD.Exif).get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    taken_at = None
+    if taken:
+        try:
+            taken_at = datetime.strptime(str(taken).strip('\x00 '), '%Y:%m:%d %H:%M:%S').timestamp()
+        except ValueError:
+            pass
+    return orientation, taken_at
+
+class Histogram:
+    """Bucket counts, sum and maximum of observed values"""
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last bucket is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile, capped by the maximum"""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.sum / self.count, 4) if self.count else None,
+            'p50': round(self.quantile(0.5), 4),
+            'p90': round(self.quantile(0.9), 4),
+            'p99': round(self.quantile(0.99), 4),
+            'max': round(self.max, 4),
+        }
+
+class Metrics:
+    """Histograms and counters of the display and sync pipeline.
+    When disabled every call returns right away, so instrumented code needs no checks of its own.
+    Histograms are keyed by name and an optional stage label, values accumulate since startup."""
+    def __init__(self, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.histograms = {}  # (name, stage) -> Histogram
+        self.counters = {}  # name -> total
+        self.lock = threading.Lock()
+
+    def observe(self, name, value, stage=None, buckets=METRICS_SECONDS_BUCKETS):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get((name, stage))
+            if histogram is None:
+                histogram = self.histograms[(name, stage)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def add(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timed(self, name, stage=None):
+        """Context manager adding the seconds spent inside to a histogram"""
+        if not self.enabled:
+            return nullcontext()
+        return self.timer(name, stage)
+
+    @contextmanager
+    def timer(self, name, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, stage)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            declared = set()
+            for (name, stage), histogram in sorted(self.histograms.items(), key=lambda item: (item[0][0], item[0][1] or '')):
+                metric = f"magicframe_{name}"
+                if metric not in declared:
+                    lines.append(f"# TYPE {metric} histogram")
+                    declared.add(metric)
+                labels = f'stage="{stage}",' if stage else ''
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{{labels}le="{bound}"}} {cumulative}')
+                labels = f'{{stage="{stage}"}}' if stage else ''
+                lines.append(f"{metric}_sum{labels} {histogram.sum}")
+                lines.append(f"{metric}_count{labels} {histogram.count}")
+            for name, total in sorted(self.counters.items()):
+                lines.append(f"# TYPE magicframe_{name} counter")
+                lines.append(f"magicframe_{name} {total}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Summary of every histogram and counter for the stats file"""
+        with self.lock:
+            return {
+                'time': datetime.now().isoformat(timespec='seconds'),
+                'histograms': {f"{name}.{stage}" if stage else name: histogram.summary()
+                               for (name, stage), histogram in self.histograms.items()},
+                'counters': dict(self.counters),
+            }
+
+metrics = Metrics()
+
+class MetricsReporter(threading.Thread):
+    """Serves the metrics on localhost and appends a snapshot to a rotating stats file"""
+    def __init__(self, metrics, port=METRICS_PORT, stats_file=METRICS_STATS_FILE, interval=METRICS_STATS_INTERVAL):
+        super().__init__(daemon=True)
+        self.metrics = metrics
+        self.port = port
+        self.stats_file = stats_file
+        self.interval = interval
+        self.server = None
+
+    def run(self):
+        if self.port is not None:
+            self.start_server()
+        while True:
+            time.sleep(self.interval)
+            self.write_stats()
+
+    def start_server(self):
+        metrics = self.metrics
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            # Only reachable from the frame itself, e.g. through an SSH tunnel
+            self.server = ThreadingHTTPServer(('127.0.0.1', self.port), MetricsHandler)
+        except OSError as e:
+            print(f"Error starting metrics endpoint: {str(e)}")
+            return
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        print(f"Metrics on http://127.0.0.1:{self.server.server_address[1]}/metrics")
+
+    def write_stats(self):
+        try:
+            os.makedirs(os.path.dirname(self.stats_file), exist_ok=True)
+            if os.path.exists(self.stats_file) and os.path.getsize(self.stats_file) > METRICS_STATS_MAX_BYTES:
+                # stats.jsonl -> stats.jsonl.1 -> stats.jsonl.2 ..., the oldest is overwritten
+                for index in range(METRICS_STATS_BACKUPS - 1, 0, -1):
+                    if os.path.exists(f"{self.stats_file}.{index}"):
+                        os.replace(f"{self.stats_file}.{index}", f"{self.stats_file}.{index + 1}")
+                os.replace(self.stats_file, f"{self.stats_file}.1")
+            with open(self.stats_file, 'a') as f:
+                f.write(json.dumps(self.metrics.snapshot()) + '\n')
+        except OSError as e:
+            print(f"Error writing stats file: {str(e)}")
+
+class StageTimer:
+    """Times consecutive stages into a dict of per-stage seconds and the image_stage_seconds
+    histogram, does nothing when neither is wanted"""
+    def __init__(self, timings=None):
+        self.timings = timings
+        self.active = timings is not None or metrics.enabled
+        self.last = time.perf_counter() if self.active else None
+
+    def lap(self, stage):
+        if not self.active:
+            return
+        now = time.perf_counter()
+        if self.timings is not None:
+            self.timings[stage] = self.timings.get(stage, 0) + now - self.last
+        metrics.observe('image_stage_seconds', now - self.last, stage)
+        self.last = now
+
+def prepare_image(image_path, screen_width, screen_height, resample=Image.LANCZOS, reduced_decode=None,
+                  orientation=None, timings=None):
+    """Open an image, apply its EXIF orientation and scale it to fit the screen.
+    Pass the orientation when it is already known, e.g. from the library index.
+    If timings is a dict it receives the seconds spent in each stage."""
+    if reduced_decode is None:
+        reduced_decode = REDUCED_DECODE
+    timer = StageTimer(timings)
+    image = Image.open(image_path)
+    timer.lap('open')
+    if orientation is None:
+        orientation = read_exif(image)[0]
+        timer.lap('exif')
+
+    if reduced_decode:
+        # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding. The target is
+        # the final on-screen size in the file's own orientation, the decoder never goes below it.
+        if orientation in (5, 6, 7, 8):
+            target = fit_to_screen(image.width, image.height, screen_height, screen_width)
+        else:
+            target = fit_to_screen(image.width, image.height, screen_width, screen_height)
+        image.draft(image.mode, target)
+    image.load()
+    timer.lap('decode')
+
+    # Apply EXIF orientation
+    transpose = ORIENTATION_TRANSPOSE.get(orientation)
+    if transpose is not None:
+        image = image.transpose(transpose)
+    timer.lap('orient')
+
+    new_size = fit_to_screen(image.width, image.height, screen_width, screen_height)
+    if reduced_decode:
+        # Formats without draft support (PNG, GIF) get a cheap box reduction before the final filter
+        image = image.resize(new_size, resample, reducing_gap=3.0)
+    else:
+        image = image.resize(new_size, resample)
+    timer.lap('resize')
+    return image
+
+class RenderCache:
+    """On-disk LRU cache of oriented, screen-sized copies of the slideshow images.
+    Entries are keyed by the SHA-256 of the file, screen geometry and resampling filter."""
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, max_bytes=RENDER_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hashes = {}  # (path, size, mtime) -> content hash, avoids rehashing unchanged files
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Only scan the directory once, afterwards the total is kept up to date
+        self.total_bytes = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                self.total_bytes += entry.stat().st_size
+
+    def content_hash(self, image_path):
+        # Files from the photo store are named after their hash already
+        digest = PhotoStore.hash_from_path(image_path)
+        if digest:
+            return digest
+
+        stat = os.stat(image_path)
+        stat_key = (image_path, stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            cached = self.hashes.get(stat_key)
+        if cached:
+            return cached
+
+        digest = PhotoStore.hash_file(image_path)
+        with self.lock:
+            self.hashes[stat_key] = digest
+        return digest
+
+    def cache_key(self, image_path, screen_width, screen_height, resample):
+        return f"{self.content_hash(image_path)}_{screen_width}x{screen_height}_{resample}"
+
+    def entry_path(self, key):
+        """Path of the cached copy for a key, or None when it has not been rendered"""
+        for ext in ('.jpg', '.png'):
+            cache_path = os.path.join(self.cache_dir, key + ext)
+            if os.path.exists(cache_path):
+                return cache_path
+        return None
+
+    def load(self, image_path, screen_width, screen_height, resample=Image.LANCZOS, orientation=None):
+        """Return the screen-sized image, rendering and storing it on a cache miss"""
+        key = self.cache_key(image_path, screen_width, screen_height, resample)
+
+        for ext in ('.jpg', '.png'):
+            cache_path = os.path.join(self.cache_dir, key + ext)
+            timer = StageTimer()
+            try:
+                image = Image.open(cache_path)
+                image.load()
+            except OSError:
+                # Missing or unreadable entry, try the other format or render again
+                continue
+            timer.lap('cache')
+            # Bump the modification time, it doubles as the LRU timestamp
+            try:
+                os.utime(cache_path)
+            except OSError:
+                pass
+            return image
+
+        image = prepare_image(image_path, screen_width, screen_height, resample, orientation=orientation)
+        self.store(key, image)
+        return image
+
+    def store(self, key, image):
+        # JPEG is smallest and fastest to load, keep PNG for images with transparency or palettes
+        if image.mode == 'RGB':
+            cache_path = os.path.join(self.cache_dir, key + '.jpg')
+            save_args = {'format': 'JPEG', 'quality': RENDER_CACHE_JPEG_QUALITY}
+        else:
+            cache_path = os.path.join(self.cache_dir, key + '.png')
+            save_args = {'format': 'PNG'}
+
+        # Write to a temporary name first so a crash never leaves a truncated entry. The name is
+        # unique per process and thread, prerender.py fills the cache from several processes.
+        temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            image.save(temp_path, **save_args)
+            os.replace(temp_path, cache_path)
+            size = os.path.getsize(cache_path)
+        except Exception as e:
+            print(f"Error writing render cache entry: {str(e)}")
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            return
+
+        with self.lock:
+            self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache is back under 90% of its budget"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+
+        self.total_bytes = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.unlink(path)
+                self.total_bytes -= size
+            except OSError:
+                pass
+
+class LibraryIndex:
+    """Persistent SQLite index of the images in IMAGE_DIR.
+    Records size, mtime, dimensions, EXIF orientation and capture time and is updated one
+    file at a time, so EXIF is parsed once per file instead of on every display."""
+    def __init__(self, image_dir=IMAGE_DIR, db_path=LIBRARY_DB):
+        self.image_dir = image_dir
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                orientation INTEGER,
+                added_at REAL NOT NULL,
+                taken_at REAL,
+                views INTEGER NOT NULL DEFAULT 0,
+                original_size INTEGER
+            )
+        ''')
+        # original_size is set while the file is a screen-sized copy of a larger original
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(images)')]
+        for column, definition in (('taken_at', 'REAL'), ('views', 'INTEGER NOT NULL DEFAULT 0'),
+                                   ('original_size', 'INTEGER')):
+            if column not in columns:
+                self.db.execute(f'ALTER TABLE images ADD COLUMN {column} {definition}')
+        if 'taken_at' not in columns:
+            # Indexes from older versions lack the capture time, clearing mtime makes the
+            # next reconcile read every header again
+            self.db.execute('UPDATE images SET mtime = 0')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS names (
+                hash TEXT NOT NULL,
+                original_name TEXT NOT NULL,
+                source TEXT,
+                remote_id INTEGER,
+                added_at REAL NOT NULL,
+                UNIQUE(hash, original_name)
+            )
+        ''')
+        self.db.commit()
+
+    @staticmethod
+    def is_image(path):
+        filename = os.path.basename(path)
+        return not filename.startswith('.') and os.path.splitext(filename)[1].lower() in SUPPORTED_FORMATS
+
+    @staticmethod
+    def read_header(path):
+        """Return (width, height, orientation, taken_at) without decoding the pixel data"""
+        try:
+            with metrics.timed('image_stage_seconds', 'exif'), Image.open(path) as image:
+                return (image.width, image.height) + read_exif(image)
+        except Exception as e:
+            print(f"Error reading image header {path}: {str(e)}")
+            return None, None, None, None
+
+    def _update(self, path):
+        """Insert or refresh one file, returns True if it was new or changed"""
+        stat = os.stat(path)
+        row = self.db.execute('SELECT size, mtime FROM images WHERE path = ?', (path,)).fetchone()
+        if row == (stat.st_size, stat.st_mtime_ns):
+            return False
+
+        width, height, orientation, taken_at = self.read_header(path)
+        self.db.execute('''
+            INSERT INTO images (path, size, mtime, width, height, orientation, added_at, taken_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(path) DO UPDATE SET
+                size = excluded.size, mtime = excluded.mtime, width = excluded.width,
+                height = excluded.height, orientation = excluded.orientation, taken_at = excluded.taken_at
+        ''', (path, stat.st_size, stat.st_mtime_ns, width, height, orientation, time.time(), taken_at))
+        return True
+
+    def add(self, path):
+        if not self.is_image(path):
+            return False
+        with self.lock:
+            try:
+                changed = self._update(path)
+            except OSError:
+                return False
+            self.db.commit()
+        return changed
+
+    def remove(self, path):
+        with self.lock:
+            self.db.execute('DELETE FROM images WHERE path = ?', (path,))
+            self.db.commit()
+
+    def reconcile(self):
+        """Bring the index in line with the directory, e.g. after files were copied while the
+        frame was off. Unchanged files only cost a stat call."""
+        with self.lock:
+            present = set()
+            for entry in os.scandir(self.image_dir):
+                if entry.is_file() and self.is_image(entry.path):
+                    present.add(entry.path)
+                    self._update(entry.path)
+
+            indexed = {row[0] for row in self.db.execute('SELECT path FROM images')}
+            self.db.executemany('DELETE FROM images WHERE path = ?', [(path,) for path in indexed - present])
+            self.db.commit()
+
+    def entries(self):
+        """Return (path, added_at, taken_at) for every indexed image"""
+        with self.lock:
+            return self.db.execute('SELECT path, added_at, taken_at FROM images ORDER BY added_at').fetchall()
+
+    def orientation(self, path):
+        """Return the indexed EXIF orientation, or None if the file is not indexed"""
+        with self.lock:
+            row = self.db.execute('SELECT orientation FROM images WHERE path = ?', (path,)).fetchone()
+        return row[0] if row else None
+
+    def add_name(self, digest, original_name, source=None, remote_id=None):
+        """Remember under which name (and server image id) a stored photo arrived"""
+        with self.lock:
+            self.db.execute('''
+                INSERT OR IGNORE INTO names (hash, original_name, source, remote_id, added_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (digest, original_name, source, remote_id, time.time()))
+            self.db.commit()
+
+    def add_views(self, views):
+        """Add to the view counts, views maps path -> number of new views"""
+        with self.lock:
+            self.db.executemany('UPDATE images SET views = views + ? WHERE path = ?',
+                                [(count, path) for path, count in views.items()])
+            self.db.commit()
+
+    def set_original_size(self, path, original_size):
+        """Mark a file as a shrunk copy of an original of the given size, None marks it as the original"""
+        with self.lock:
+            self.db.execute('UPDATE images SET original_size = ? WHERE path = ?', (original_size, path))
+            self.db.commit()
+
+    def is_shrunk(self, path):
+        with self.lock:
+            row = self.db.execute('SELECT original_size FROM images WHERE path = ?', (path,)).fetchone()
+        return bool(row and row[0] is not None)
+
+    def shrink_candidates(self, min_pixels, recoverable_only=False, limit=50, offset=0):
+        """Full-size originals larger than min_pixels, least viewed and oldest first. With
+        recoverable_only only store files the server can send again, i.e. with a remote id."""
+        recoverable = ''
+        params = [min_pixels]
+        if recoverable_only:
+            # Store files are named <hash>.<ext> directly in image_dir
+            recoverable = '''AND EXISTS (SELECT 1 FROM names
+                WHERE names.hash = substr(images.path, ?, 64) AND names.remote_id IS NOT NULL)'''
+            params.append(len(os.path.join(self.image_dir, '')) + 1)
+        with self.lock:
+            return self.db.execute(f'''
+                SELECT path FROM images
+                WHERE original_size IS NULL AND width * height > ? {recoverable}
+                ORDER BY views, added_at LIMIT ? OFFSET ?
+            ''', params + [limit, offset]).fetchall()
+
+    def restore_candidates(self, limit=20):
+        """Shrunk files with the size of their original, most viewed first"""
+        with self.lock:
+            return self.db.execute('''
+                SELECT path, original_size FROM images
+                WHERE original_size IS NOT NULL ORDER BY views DESC LIMIT ?
+            ''', (limit,)).fetchall()
+
+    def usage(self):
+        """Return (bytes, files, shrunk files, bytes saved by shrinking)"""
+        with self.lock:
+            return self.db.execute('''
+                SELECT COALESCE(SUM(size), 0), COUNT(*), COUNT(original_size),
+                       COALESCE(SUM(original_size - size), 0)
+                FROM images
+            ''').fetchone()
+
+    def names_for(self, digest):
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT original_name, source, remote_id FROM names WHERE hash = ? ORDER BY added_at',
+                (digest,)).fetchall()
+        return [dict(zip(('original_name', 'source', 'remote_id'), row)) for row in rows]
+
+class PhotoStore:
+    """Content-addressed store for downloaded photos.
+    Files are named after the SHA-256 of their bytes, so a photo shared twice is stored once
+    and two different photos that both arrived as IMG_0001.jpg never overwrite each other.
+    Original names are kept in the library index."""
+    HASH_NAME = re.compile(r'^[0-9a-f]{64}$')
+
+    def __init__(self, library, image_dir=IMAGE_DIR):
+        self.library = library
+        self.image_dir = image_dir
+        self.lock = threading.Lock()
+
+        # Temporary files left by an interrupted run, resumable sync downloads are kept
+        for entry in os.scandir(self.image_dir):
+            if entry.name.startswith('.') and entry.name.endswith('.part') and not entry.name.startswith('.sync-'):
+                os.unlink(entry.path)
+
+    @staticmethod
+    def hash_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def hash_from_path(cls, path):
+        """Return the content hash encoded in a store file name, or None for other files"""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return stem if cls.HASH_NAME.match(stem) else None
+
+    def temp_file(self):
+        """Return (fd, path) of a hidden temporary file in the store directory"""
+        return tempfile.mkstemp(dir=self.image_dir, prefix='.', suffix='.part')
+
+    def ingest(self, temp_path, original_name, digest=None, source=None, remote_id=None, ext=None):
+        """Move a finished temporary file into the store and return its final path.
+        If the same bytes are already stored the temporary file is dropped. ext overrides the
+        extension of original_name, e.g. for a JPEG rendition of a PNG."""
+        if digest is None:
+            digest = self.hash_file(temp_path)
+        ext = (ext or os.path.splitext(original_name)[1]).lower()
+        if ext == '.jpeg':
+            ext = '.jpg'
+        if ext not in SUPPORTED_FORMATS:
+            ext = '.jpg'
+
+        with self.lock:
+            existing = self.find(digest)
+            if existing and self.library.is_shrunk(existing):
+                # The original of a shrunk copy came back, put it in place of the copy
+                os.replace(temp_path, existing)
+                self.library.set_original_size(existing, None)
+                self.library.add(existing)
+                path = existing
+            elif existing:
+                os.unlink(temp_path)
+                path = existing
+            else:
+                path = os.path.join(self.image_dir, digest + ext)
+                os.replace(temp_path, path)
+        self.library.add_name(digest, original_name, source, remote_id)
+        return path
+
+    def find(self, digest):
+        for ext in SUPPORTED_FORMATS:
+            path = os.path.join(self.image_dir, digest + ext)
+            if os.path.exists(path):
+                return path
+        return None
+
+class StorageManager:
+    """Keeps the photos within a disk budget.
+    When IMAGE_DIR grows past the budget, or the SD card runs low on space, the least viewed
+    and oldest originals are replaced by screen-sized copies under the same name, so every
+    photo stays in the slideshow. Originals that came from the server can be downloaded
+    again later; while usage is well below the budget the most viewed ones are restored.
+    Runs on the sync worker thread, views are recorded from the Tk thread."""
+    def __init__(self, library, store, display_size, fetch_original, render_cache=None,
+                 budget=STORAGE_BUDGET_BYTES, min_free=STORAGE_MIN_FREE_BYTES):
+        self.library = library
+        self.store = store
+        self.display_size = display_size
+        self.fetch_original = fetch_original
+        self.render_cache = render_cache
+        self.budget = budget
+        self.min_free = min_free
+        self.views = {}  # path -> views not written to the index yet
+        self.views_lock = threading.Lock()
+        self.failed = set()  # originals that could not be shrunk this run
+
+    def record_view(self, path):
+        with self.views_lock:
+            self.views[path] = self.views.get(path, 0) + 1
+
+    def flush_views(self):
+        with self.views_lock:
+            views, self.views = self.views, {}
+        if views:
+            self.library.add_views(views)
+
+    def free_space(self):
+        return shutil.disk_usage(self.store.image_dir).free
+
+    def needs_room(self, target=1.0):
+        used = self.library.usage()[0]
+        return (self.budget is not None and used > self.budget * target) or self.free_space() < self.min_free
+
+    def remote_id(self, path):
+        """Server id to download the original again with, or None"""
+        digest = PhotoStore.hash_from_path(path)
+        if digest:
+            for name in self.library.names_for(digest):
+                if name['remote_id'] is not None:
+                    return name['remote_id']
+        return None
+
+    def enforce(self):
+        """Shrink originals until the budget is met, otherwise restore one original"""
+        self.flush_views()
+        changed = False
+        if self.needs_room():
+            while self.needs_room(STORAGE_SHRINK_TARGET):
+                path = self.next_to_shrink()
+                if path is None:
+                    print("Storage budget exceeded and no original left to shrink")
+                    break
+                changed = self.shrink(path) or changed
+        else:
+            changed = self.restore_one()
+        if changed:
+            print(f"Storage: {self.report()}")
+
+    def next_to_shrink(self):
+        screen_width, screen_height = self.display_size
+        # Only files noticeably larger than the screen are worth shrinking
+        min_pixels = screen_width * screen_height * 1.5
+        offset = 0
+        while True:
+            candidates = self.library.shrink_candidates(min_pixels, STORAGE_KEEP_UNRECOVERABLE, offset=offset)
+            for (path,) in candidates:
+                if path not in self.failed:
+                    return path
+            if not candidates:
+                return None
+            offset += len(candidates)
+
+    def shrink(self, path):
+        """Replace an original by a screen-sized copy under the same name"""
+        fd, temp_path = self.store.temp_file()
+        os.close(fd)
+        try:
+            original_size = os.path.getsize(path)
+            image = prepare_image(path, *self.display_size, orientation=self.library.orientation(path))
+            ext = os.path.splitext(path)[1].lower()
+            if ext in ('.jpg', '.jpeg'):
+                image.convert('RGB').save(temp_path, 'JPEG', quality=STORAGE_RENDITION_QUALITY)
+            else:
+                image.save(temp_path, Image.registered_extensions()[ext])
+            self.library.set_original_size(path, original_size)
+            os.replace(temp_path, path)
+            self.library.add(path)
+            return True
+        except Exception as e:
+            print(f"Error shrinking {path}: {str(e)}")
+            self.failed.add(path)
+            return False
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def restore_one(self):
+        """Download the most viewed shrunk original that fits comfortably, returns True if one was"""
+        if self.budget is None:
+            return False
+        used = self.library.usage()[0]
+        free = self.free_space()
+        for path, original_size in self.library.restore_candidates():
+            if used + original_size > self.budget * STORAGE_RESTORE_BELOW or free - original_size < 2 * self.min_free:
+                continue
+            remote_id = self.remote_id(path)
+            if remote_id is None:
+                continue
+            try:
+                self.fetch_original(remote_id)
+            except Exception as e:
+                print(f"Error restoring original of {path}: {str(e)}")
+                return False
+            return not self.library.is_shrunk(path)
+        return False
+
+    def report(self):
+        used, files, shrunk, saved = self.library.usage()
+        return {
+            'budget': self.budget,
+            'used': used,
+            'photos': files,
+            'shrunk': shrunk,
+            'saved': saved,
+            'render_cache': self.render_cache.total_bytes if self.render_cache else None,
+            'free': self.free_space(),
+        }
+
+class ImageDirWatcher(threading.Thread):
+    """Watches a directory and reports added and removed images once their writes have settled.
+    Uses inotify on Linux and falls back to polling elsewhere. on_change(added, removed) is
+    called from the watcher thread."""
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, directory, on_change, debounce=WATCH_DEBOUNCE, poll_interval=WATCH_POLL_INTERVAL):
+        super().__init__(daemon=True, name="image-dir-watcher")
+        self.directory = directory
+        self.on_change = on_change
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.pending = {}  # path -> time of the last write event
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        try:
+            self.watch_inotify()
+        except OSError as e:
+            print(f"inotify unavailable ({str(e)}), polling {self.directory} instead")
+            self.watch_polling()
+
+    def watch_inotify(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fd = libc.inotify_init1(self.IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        try:
+            mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_MOVED_FROM | self.IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(self.directory), mask) < 0:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+            while not self.stopped.is_set():
+                # Sleep until the next event, or until a pending file has been quiet long enough
+                timeout = self.debounce if self.pending else 1.0
+                readable, _, _ = select.select([fd], [], [], timeout)
+                if readable:
+                    self.read_events(os.read(fd, 64 * 1024))
+                self.flush_pending()
+        finally:
+            os.close(fd)
+
+    def read_events(self, data):
+        removed = []
+        offset = 0
+        while offset < len(data):
+            _, event_mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_length].rstrip(b'\0'))
+            offset += name_length
+
+            if event_mask & self.IN_Q_OVERFLOW:
+                # Events were lost, treat every file as possibly new
+                for entry in os.scandir(self.directory):
+                    self.pending[entry.path] = time.monotonic()
+                continue
+
+            path = os.path.join(self.directory, name)
+            if event_mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                self.pending.pop(path, None)
+                removed.append(path)
+            else:
+                self.pending[path] = time.monotonic()
+
+        if removed:
+            self.on_change([], removed)
+
+    def watch_polling(self):
+        known = self.scan()
+        while not self.stopped.wait(self.poll_interval):
+            current = self.scan()
+            for path, signature in current.items():
+                if known.get(path) != signature:
+                    self.pending[path] = time.monotonic()
+            removed = [path for path in known if path not in current]
+            if removed:
+                self.on_change([], removed)
+            known = current
+            self.flush_pending()
+
+    def scan(self):
+        signatures = {}
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                stat = entry.stat()
+                signatures[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def flush_pending(self):
+        """Report files whose last write is at least debounce seconds old"""
+        now = time.monotonic()
+        settled = [path for path, last_event in self.pending.items() if now - last_event >= self.debounce]
+        for path in settled:
+            del self.pending[path]
+        added = [path for path in settled if os.path.isfile(path)]
+        if added:
+            self.on_change(added, [])
+
+class FrameCache:
+    """In-memory LRU of display-ready frames, bounded by an approximate byte budget.
+    Only used from the Tk thread."""
+    def __init__(self, max_bytes=FRAME_CACHE_MAX_BYTES, min_available=FRAME_CACHE_MIN_AVAILABLE):
+        self.max_bytes = max_bytes
+        self.min_available = min_available
+        self.frames = OrderedDict()  # key -> (frame, size in bytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.frames
+
+    def get(self, key):
+        entry = self.frames.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        self.frames.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, frame, size):
+        """Store a freshly built frame, every put counts as one cache miss"""
+        self.misses += 1
+        if key in self.frames:
+            self.total_bytes -= self.frames.pop(key)[1]
+        self.frames[key] = (frame, size)
+        self.total_bytes += size
+        self.trim()
+
+    def trim(self):
+        """Evict the least recently used frames until the budget and free memory allow it"""
+        while self.total_bytes > self.max_bytes and len(self.frames) > 1:
+            self.evict_oldest()
+
+        available = self.available_memory()
+        if available is not None and available < self.min_available:
+            needed = self.min_available - available
+            while needed > 0 and len(self.frames) > 1:
+                needed -= self.evict_oldest()
+
+    def clear(self):
+        self.frames.clear()
+        self.total_bytes = 0
+
+    def evict_oldest(self):
+        _, (_, size) = self.frames.popitem(last=False)
+        self.total_bytes -= size
+        self.evictions += 1
+        return size
+
+    @staticmethod
+    def available_memory():
+        """Return MemAvailable in bytes, or None where /proc/meminfo does not exist"""
+        try:
+            with open('/proc/meminfo') as f:
+                for line in f:
+                    if line.startswith('MemAvailable:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return None
+
+    def stats(self):
+        return {
+            'frames': len(self.frames),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+class MmapFrameStore:
+    """Screen-ready frames kept as raw RGB in one memory-mapped file.
+    The file has a fixed number of slots, each large enough for a full-screen frame and
+    found by a hash of the frame key. Showing a stored frame needs no decoding, the renderer
+    gets a memoryview of the slot. When the store is full the least recently used slot is
+    reused. Only used from the Tk thread."""
+    MAGIC = b'MFRAMES1'
+    FILE_HEADER = struct.Struct('<8sIII')  # magic, screen width, screen height, slot count
+    SLOT_HEADER = struct.Struct('<32sII')  # key digest, frame width, frame height (0 = empty)
+
+    def __init__(self, path, screen_width, screen_height, slots=FRAME_STORE_SLOTS):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.slot_size = self.SLOT_HEADER.size + screen_width * screen_height * 3
+        size = self.FILE_HEADER.size + slots * self.slot_size
+        header = self.FILE_HEADER.pack(self.MAGIC, screen_width, screen_height, slots)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b')
+        if self.file.read(self.FILE_HEADER.size) != header or os.path.getsize(path) != size:
+            # New file or a different screen, start empty. The file is sparse until filled.
+            self.file.truncate(0)
+            self.file.truncate(size)
+            self.file.seek(0)
+            self.file.write(header)
+            self.file.flush()
+        self.mm = mmap.mmap(self.file.fileno(), size)
+
+        self.slots = OrderedDict()  # key digest -> slot, least recently used first
+        self.free = []
+        for slot in range(slots):
+            digest, width, _ = self.SLOT_HEADER.unpack_from(self.mm, self.slot_offset(slot))
+            if width:
+                self.slots[digest] = slot
+            else:
+                self.free.append(slot)
+
+    def slot_offset(self, slot):
+        return self.FILE_HEADER.size + slot * self.slot_size
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha256(repr(key).encode()).digest()
+
+    def __contains__(self, key):
+        return self.digest(key) in self.slots
+
+    def get(self, key):
+        """Return (memoryview of the RGB pixels, (width, height)) or None"""
+        digest = self.digest(key)
+        slot = self.slots.get(digest)
+        if slot is None:
+            return None
+        self.slots.move_to_end(digest)
+        offset = self.slot_offset(slot)
+        _, width, height = self.SLOT_HEADER.unpack_from(self.mm, offset)
+        start = offset + self.SLOT_HEADER.size
+        return memoryview(self.mm)[start:start + width * height * 3], (width, height)
+
+    def image(self, key):
+        """Return a copy of the stored frame as an image, or None"""
+        stored = self.get(key)
+        if stored is None:
+            return None
+        pixels, size = stored
+        return Image.frombytes('RGB', size, pixels)
+
+    def put(self, key, image):
+        if image.width > self.screen_width or image.height > self.screen_height:
+            return
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        digest = self.digest(key)
+        slot = self.slots.pop(digest, None)
+        if slot is None:
+            slot = self.free.pop() if self.free else self.slots.popitem(last=False)[1]
+
+        # Mark the slot empty while it is rewritten, so a crash cannot leave a torn frame
+        offset = self.slot_offset(slot)
+        self.SLOT_HEADER.pack_into(self.mm, offset, b'', 0, 0)
+        start = offset + self.SLOT_HEADER.size
+        self.mm[start:start + image.width * image.height * 3] = image.tobytes()
+        self.SLOT_HEADER.pack_into(self.mm, offset, digest, image.width, image.height)
+        self.slots[digest] = slot
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+class TkRenderer:
+    """Shows frames in a fullscreen Tk label. Every frame is copied through Tcl once when
+    it is made, the frame cache keeps the resulting PhotoImages."""
+    name = "tk"
+
+    def __init__(self, root, on_exit):
+        self.root = root
+        self.on_exit = on_exit
+        self.frame = None
+        self.label = None
+        self.scratch = None  # PhotoImage reused for transition frames
+
+    def open(self):
+        self.frame = tk.Frame(self.root, bg='black')
+        self.frame.pack(fill=tk.BOTH, expand=True)
+        self.label = tk.Label(self.frame, bg='black')
+        self.label.pack(fill=tk.BOTH, expand=True)
+
+        # Bind click events to exit slideshow
+        self.frame.bind("<Button-1>", self.on_exit)
+        self.label.bind("<Button-1>", self.on_exit)
+        return True
+
+    def make_frame(self, image):
+        return ImageTk.PhotoImage(image)
+
+    def frame_from_buffer(self, pixels, size):
+        """Make a frame from raw RGB pixels, Tk needs its own copy"""
+        return ImageTk.PhotoImage(Image.frombuffer('RGB', size, pixels, 'raw', 'RGB', 0, 1))
+
+    def frame_bytes(self, frame):
+        # Tk keeps 4 bytes per pixel
+        return frame.width() * frame.height() * 4
+
+    def show(self, frame):
+        self.label.config(image=frame)
+        self.label.image = frame  # Keep reference
+
+    def present(self, image):
+        """Show a transient image, reusing one PhotoImage for all of them"""
+        if self.scratch is None or (self.scratch.width(), self.scratch.height()) != image.size:
+            self.scratch = ImageTk.PhotoImage(image)
+        else:
+            self.scratch.paste(image)
+        self.show(self.scratch)
+
+    def close(self):
+        if self.frame:
+            self.frame.destroy()
+            self.frame = None
+            self.label = None
+        self.scratch = None
+
+class PygameRenderer:
+    """Presents frames fullscreen through pygame/SDL. On a Pi without a desktop SDL drives
+    the display directly through KMS/DRM, otherwise it opens a fullscreen window.
+    Frames are converted to the display's pixel format once when they are made, showing
+    one is a single blit and flip. The Tk window is hidden while the renderer is open and
+    input is polled from the Tk event loop, so pygame is only used from the Tk thread."""
+    name = "pygame"
+
+    def __init__(self, root, on_exit, drivers=PYGAME_VIDEO_DRIVERS):
+        self.root = root
+        self.on_exit = on_exit
+        self.drivers = drivers
+        self.pygame = None
+        self.screen = None
+        self.poll_job = None
+
+    def open(self):
+        """Initialise the first video driver that works, returns False if none does"""
+        try:
+            import pygame
+        except ImportError:
+            print("pygame is not installed")
+            return False
+        self.pygame = pygame
+
+        for driver in self.drivers:
+            os.environ['SDL_VIDEODRIVER'] = driver
+            try:
+                pygame.display.init()
+                self.screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+                break
+            except pygame.error as e:
+                print(f"SDL video driver {driver} unavailable: {str(e)}")
+                pygame.display.quit()
+        else:
+            return False
+
+        print(f"Rendering with pygame on the {pygame.display.get_driver()} driver")
+        pygame.mouse.set_visible(False)
+        self.screen.fill((0, 0, 0))
+        pygame.display.flip()
+        self.root.withdraw()
+        self.poll_job = self.root.after(PYGAME_EVENT_POLL_INTERVAL, self.poll_events)
+        return True
+
+    def make_frame(self, image):
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+        surface = self.pygame.image.frombuffer(image.tobytes(), image.size, image.mode)
+        # Converting copies the pixels into the display format, so blits need no conversion
+        return surface.convert_alpha() if image.mode == 'RGBA' else surface.convert()
+
+    def frame_from_buffer(self, pixels, size):
+        """Make a frame that reads raw RGB pixels in place, without copying them"""
+        return self.pygame.image.frombuffer(pixels, size, 'RGB')
+
+    def frame_bytes(self, frame):
+        return frame.get_pitch() * frame.get_height()
+
+    def show(self, frame):
+        screen_width, screen_height = self.screen.get_size()
+        self.screen.fill((0, 0, 0))
+        self.screen.blit(frame, ((screen_width - frame.get_width()) // 2,
+                                 (screen_height - frame.get_height()) // 2))
+        self.pygame.display.flip()
+
+    def present(self, image):
+        """Show a transient image without converting it to the display format first"""
+        self.show(self.pygame.image.frombuffer(image.tobytes(), image.size, image.mode))
+
+    def poll_events(self):
+        self.poll_job = None
+        exit_events = (self.pygame.QUIT, self.pygame.MOUSEBUTTONDOWN,
+                       self.pygame.KEYDOWN, self.pygame.FINGERDOWN)
+        for event in self.pygame.event.get():
+            if event.type in exit_events:
+                self.on_exit()
+                return
+        self.poll_job = self.root.after(PYGAME_EVENT_POLL_INTERVAL, self.poll_events)
+
+    def close(self):
+        if self.poll_job:
+            self.root.after_cancel(self.poll_job)
+            self.poll_job = None
+        if self.screen:
+            self.pygame.display.quit()
+            self.screen = None
+            self.root.deiconify()
+
+class RandomBag:
+    """Set of paths with O(1) add, remove and random pop"""
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, path):
+        if path not in self.positions:
+            self.positions[path] = len(self.items)
+            self.items.append(path)
+
+    def remove(self, path):
+        position = self.positions.pop(path, None)
+        if position is None:
+            return
+        # Move the last item into the gap
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def pop_random(self, rng):
+        path = self.items[rng.randrange(len(self.items))]
+        self.remove(path)
+        return path
+
+class PlaybackScheduler:
+    """Decides the order of the slideshow.
+    Images waiting to be drawn sit in two bags, recent and the rest, and a share of the
+    draws comes from the recent one. Recent are images added in the last recent_days and
+    photos taken around today's date in earlier years. Newly arrived images are queued
+    ahead of both and shown right after the images already planned. A drawn image cools down until
+    no_repeat other images were drawn, so nothing repeats within that window.
+    Drawing is O(1). Draws are planned ahead on demand, peek(n) returns the next n images
+    and next() returns them in exactly that order, so prefetching never guesses wrong."""
+    def __init__(self, no_repeat=PLAYBACK_NO_REPEAT, recent_days=PLAYBACK_RECENT_DAYS,
+                 recent_share=PLAYBACK_RECENT_SHARE, anniversary_days=PLAYBACK_ANNIVERSARY_DAYS, seed=None):
+        self.no_repeat = no_repeat
+        self.recent_age = recent_days * 86400
+        self.recent_share = recent_share
+        self.anniversary_days = anniversary_days
+        self.rng = random.Random(seed)
+        self.load([])
+
+    def load(self, entries):
+        """Replace the library with (path, added_at, taken_at) entries"""
+        self.added = {}  # path -> time it was added to the library
+        self.taken = {}  # path -> EXIF capture time, for images that have one
+        self.recent = RandomBag()
+        self.older = RandomBag()
+        self.fresh = deque()  # new arrivals, shown before anything else is drawn
+        self.cooldown = deque()  # drawn images, oldest first
+        self.plan = deque()  # drawn images that have not been shown yet
+        self.shown = 0
+        for path, added_at, taken_at in entries:
+            self.added[path] = added_at
+            if taken_at is not None:
+                self.taken[path] = taken_at
+            self.bag_for(path).add(path)
+
+    def __len__(self):
+        return len(self.added)
+
+    def __contains__(self, path):
+        return path in self.added
+
+    def bag_for(self, path):
+        now = time.time()
+        if self.added[path] >= now - self.recent_age or self.is_anniversary(self.taken.get(path), now):
+            return self.recent
+        return self.older
+
+    def is_anniversary(self, taken_at, now):
+        """True for photos taken within anniversary_days of today's date in an earlier year"""
+        if taken_at is None or not self.anniversary_days:
+            return False
+        taken = datetime.fromtimestamp(taken_at)
+        today = datetime.fromtimestamp(now)
+        if taken.year >= today.year:
+            return False
+        # Compare against the neighbouring years too, so late December counts in early January
+        for year in (today.year - 1, today.year, today.year + 1):
+            try:
+                same_day = taken.replace(year=year)
+            except ValueError:
+                # 29 February
+                same_day = taken.replace(year=year, day=28)
+            if abs((same_day - today).total_seconds()) <= self.anniversary_days * 86400:
+                return True
+        return False
+
+    def add(self, paths):
+        """Queue new images to be shown soon, without disturbing the planned order"""
+        new_paths = [path for path in dict.fromkeys(paths) if path not in self.added]
+        self.rng.shuffle(new_paths)
+        now = time.time()
+        for path in new_paths:
+            self.added[path] = now
+            self.fresh.append(path)
+
+    def remove(self, path):
+        if self.added.pop(path, None) is None:
+            return
+        self.recent.remove(path)
+        self.older.remove(path)
+        self.taken.pop(path, None)
+        self.fresh = deque(queued for queued in self.fresh if queued != path)
+        self.cooldown = deque(queued for queued in self.cooldown if queued != path)
+        self.plan = deque(queued for queued in self.plan if queued != path)
+
+    def draw(self):
+        # Images that have cooled down go back into their bag
+        window = max(0, min(self.no_repeat, len(self.added) - 1))
+        while len(self.cooldown) > window:
+            path = self.cooldown.popleft()
+            self.bag_for(path).add(path)
+
+        if self.fresh:
+            path = self.fresh.popleft()
+        elif self.recent and (not self.older or self.rng.random() < self.recent_share):
+            path = self.recent.pop_random(self.rng)
+        elif self.older:
+            path = self.older.pop_random(self.rng)
+        else:
+            return None
+        self.cooldown.append(path)
+        return path
+
+    def peek(self, count):
+        """Return the next count images in the order next() will return them"""
+        while len(self.plan) < count:
+            path = self.draw()
+            if path is None:
+                break
+            self.plan.append(path)
+        return list(self.plan)[:count]
+
+    def next(self):
+        """Return the image to show now and advance"""
+        if not self.plan and not self.peek(1):
+            return None
+        self.shown += 1
+        return self.plan.popleft()
+
+class ImagePrefetcher:
+    """Prepares upcoming slideshow images on background worker threads.
+    With a library index the EXIF orientation is taken from the index instead of the file."""
+    def __init__(self, screen_width, screen_height, render_cache=None, library=None, workers=PREFETCH_WORKERS):
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.render = render_cache.load if render_cache else prepare_image
+        self.library = library
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self.pending = {}  # image path -> Future of the prepared image
+
+    def prefetch(self, image_paths):
+        """Make sure exactly the given images are being prepared, in order"""
+        # Drop work for images that fell out of the window so memory stays bounded
+        for image_path in list(self.pending):
+            if image_path not in image_paths:
+                self.pending.pop(image_path).cancel()
+
+        for image_path in image_paths:
+            if image_path not in self.pending:
+                self.pending[image_path] = self.executor.submit(
+                    self.load_image, image_path, self.screen_width, self.screen_height)
+
+    def get(self, image_path):
+        """Return the prepared image, or None if it is not finished yet.
+        Raises the worker's exception if the image could not be prepared."""
+        future = self.pending.get(image_path)
+        if future is None:
+            self.prefetch([image_path] + list(self.pending))
+            return None
+        if not future.done():
+            return None
+        del self.pending[image_path]
+        return future.result()
+
+    def load_image(self, image_path, screen_width, screen_height):
+        orientation = self.library.orientation(image_path) if self.library else None
+        return self.render(image_path, screen_width, screen_height, orientation=orientation)
+
+    def __contains__(self, image_path):
+        return image_path in self.pending
+
+    def peek(self, image_path):
+        """Return the prepared image if it is finished, leaving it for get"""
+        future = self.pending.get(image_path)
+        if future is None or not future.done():
+            return None
+        return future.result()
+
+    def shutdown(self):
+        self.prefetch([])
+        self.executor.shutdown(wait=False)
+
+class TransitionEngine:
+    """Builds the frames of a transition between two slides on a background thread.
+    Frames are screen-sized RGB images blended with Image.blend; a Ken Burns transition
+    also zooms the new image from a random point back to its normal framing. The Tk thread
+    only presents finished frames and records how long each took, a transition that is not
+    built when its slide is due is replaced by a cut."""
+    def __init__(self, screen_width, screen_height, load_image, style=TRANSITION,
+                 duration=TRANSITION_DURATION, fps=TRANSITION_FPS):
+        self.size = (screen_width, screen_height)
+        self.load_image = load_image
+        self.style = style
+        self.frame_count = max(1, int(duration * fps))
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transition")
+        self.pending = None  # (key, Future of the frames)
+        self.frame_times = deque(maxlen=500)  # seconds spent presenting each frame
+        self.build_times = deque(maxlen=50)  # seconds spent building each transition
+        self.played = 0
+        self.late = 0  # cut short because presenting fell behind
+        self.not_ready = 0  # cut because the frames were not built in time
+
+    def prepare(self, key, source, target):
+        """Start building the frames from source to target, each an image or a path"""
+        if self.pending:
+            if self.pending[0] == key:
+                return
+            self.pending[1].cancel()
+        self.pending = (key, self.executor.submit(self.build, source, target))
+
+    def take(self, key):
+        """Return the finished frames for key, or None if there are none to play"""
+        if not self.pending:
+            return None
+        pending_key, future = self.pending
+        self.pending = None
+        if pending_key != key:
+            future.cancel()
+            return None
+        if not future.done():
+            future.cancel()
+            self.not_ready += 1
+            return None
+        try:
+            return future.result()
+        except Exception as e:
+            print(f"Error building transition: {str(e)}")
+            return None
+
+    def cancel(self):
+        if self.pending:
+            self.pending[1].cancel()
+            self.pending = None
+
+    def build(self, source, target):
+        start = time.perf_counter()
+        source = self.canvas(self.resolve(source))
+        target = self.resolve(target)
+        if target.mode != 'RGB':
+            target = target.convert('RGB')
+
+        frames = []
+        focus = (random.random(), random.random())
+        target_canvas = self.canvas(target)
+        for i in range(1, self.frame_count + 1):
+            # The end points are the slides themselves, only the steps between are built
+            progress = i / (self.frame_count + 1)
+            if self.style == "kenburns":
+                target_canvas = self.canvas(self.zoom(target, 1 + KEN_BURNS_ZOOM * (1 - progress), focus))
+            frames.append(Image.blend(source, target_canvas, progress))
+
+        self.build_times.append(time.perf_counter() - start)
+        return frames
+
+    def resolve(self, image):
+        if isinstance(image, str):
+            return self.load_image(image, *self.size)
+        return image
+
+    def canvas(self, image):
+        """Centre the image on a black screen-sized RGB canvas"""
+        if image.size == self.size and image.mode == 'RGB':
+            return image
+        canvas = Image.new('RGB', self.size)
+        canvas.paste(image.convert('RGB'), ((self.size[0] - image.width) // 2,
+                                            (self.size[1] - image.height) // 2))
+        return canvas
+
+    @staticmethod
+    def zoom(image, scale, focus):
+        """Crop towards focus, given as fractions of the image size, by scale and resize back"""
+        width, height = image.size
+        crop_width, crop_height = width / scale, height / scale
+        left = (width - crop_width) * focus[0]
+        top = (height - crop_height) * focus[1]
+        return image.resize(image.size, Image.BILINEAR,
+                            box=(left, top, left + crop_width, top + crop_height))
+
+    def record_frame(self, seconds):
+        self.frame_times.append(seconds)
+
+    def stats(self):
+        frame_times = sorted(self.frame_times)
+        build_times = self.build_times
+        return {
+            'played': self.played,
+            'late': self.late,
+            'not_ready': self.not_ready,
+            'frame_ms_mean': round(sum(frame_times) / len(frame_times) * 1000, 1) if frame_times else None,
+            'frame_ms_p95': round(frame_times[int(len(frame_times) * 0.95)] * 1000, 1) if frame_times else None,
+            'build_ms_mean': round(sum(build_times) / len(build_times) * 1000) if build_times else None,
+        }
+
+    def shutdown(self):
+        self.cancel()
+        self.executor.shutdown(wait=False)
+
+class ZipRandomAccessRequired(Exception):
+    """Raised when a ZIP member cannot be extracted from a forward-only stream"""
+    def __init__(self, reason, header):
+        super().__init__(reason)
+        self.header = header  # raw bytes of the local header that was already consumed
+
+class ZipStreamReader:
+    """Reads exact byte counts from an iterator of chunks, buffering at most one chunk"""
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = bytearray()
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def read_chunks(self, size):
+        """Yield the next size bytes in pieces of at most ZIP_CHUNK_SIZE"""
+        while size > 0:
+            data = self.read(min(size, ZIP_CHUNK_SIZE))
+            if not data:
+                raise EOFError("ZIP stream ended inside a member")
+            size -= len(data)
+            yield data
+
+    def remaining(self):
+        """Yield everything not read yet"""
+        if self.buffer:
+            yield bytes(self.buffer)
+            self.buffer.clear()
+        yield from self.chunks
+
+ZIP_LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+
+def extract_zip_stream(reader, store, extracted):
+    """Extract ZIP members from a forward-only stream into the photo store as they arrive.
+    Each member is written to a hidden temporary file, CRC-checked and then moved into the
+    store. (original name, path) pairs are appended to extracted once complete. Raises
+    ZipRandomAccessRequired for members that need the central directory (data descriptors,
+    ZIP64, encryption or unsupported compression)."""
+    while True:
+        header = reader.read(ZIP_LOCAL_HEADER.size)
+        if len(header) < 4 or header[:4] in (b'PK\x01\x02', b'PK\x05\x06'):
+            # Reached the central directory, every member has been seen
+            return
+        if len(header) < ZIP_LOCAL_HEADER.size or header[:4] != b'PK\x03\x04':
+            raise zipfile.BadZipFile("Unexpected data in ZIP stream")
+
+        (_, _, flags, method, _, _, crc, compressed_size, _,
+         name_length, extra_length) = ZIP_LOCAL_HEADER.unpack(header)
+        name_and_extra = reader.read(name_length + extra_length)
+        header += name_and_extra
+
+        if flags & 0x1:
+            raise ZipRandomAccessRequired("encrypted member", header)
+        if flags & 0x8:
+            raise ZipRandomAccessRequired("sizes stored after the data", header)
+        if compressed_size == 0xFFFFFFFF:
+            raise ZipRandomAccessRequired("ZIP64 member", header)
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ZipRandomAccessRequired(f"compression method {method}", header)
+
+        filename = os.path.basename(name_and_extra[:name_length].decode('utf-8', 'replace'))
+        if not filename:
+            # Directory entry
+            for _ in reader.read_chunks(compressed_size):
+                pass
+            continue
+
+        start = time.perf_counter()
+        fd, temp_path = store.temp_file()
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS) if method == zipfile.ZIP_DEFLATED else None
+        actual_crc = 0
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as target:
+                for data in reader.read_chunks(compressed_size):
+                    if decompressor:
+                        data = decompressor.decompress(data)
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    digest.update(data)
+                    target.write(data)
+                if decompressor:
+                    data = decompressor.flush()
+                    actual_crc = zlib.crc32(data, actual_crc)
+                    digest.update(data)
+                    target.write(data)
+            if actual_crc != crc:
+                raise zipfile.BadZipFile(f"CRC mismatch for {filename}")
+            local_filename = store.ingest(temp_path, filename, digest.hexdigest(), source='zip')
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        # Includes waiting for the member's bytes, extraction runs while the archive downloads
+        metrics.observe('zip_extract_seconds', time.perf_counter() - start)
+        extracted.append((filename, local_filename))
+
+class DownloadProgress:
+    """Prints the progress of one download in 25% steps and its rate when finished"""
+    def __init__(self, name):
+        self.name = name
+        self.next_percent = 25
+        self.start = time.monotonic()
+
+    def __call__(self, written, total):
+        if total and written * 100 >= self.next_percent * total and self.next_percent < 100:
+            print(f"Downloading {self.name}: {written * 100 // total}%")
+            self.next_percent = (written * 100 // total) // 25 * 25 + 25
+
+    def done(self, written):
+        elapsed = max(time.monotonic() - self.start, 0.001)
+        print(f"Downloaded {self.name}: {written / 1024:.0f} KB at {written / 1024 / elapsed:.0f} KB/s")
+        metrics.add('download_bytes_total', written)
+        metrics.observe('download_seconds', elapsed)
+        metrics.observe('download_bytes_per_second', written / elapsed, buckets=METRICS_RATE_BUCKETS)
+
+def save_response(response, store, original_name, progress=None, source=None, remote_id=None):
+    """Stream a response body into the photo store and return (local path, bytes written).
+    The data goes to a hidden temporary file first and is moved into place once complete,
+    so the slideshow never sees a half-written image."""
+    total = int(response.headers.get('Content-Length') or 0)
+    fd, temp_path = store.temp_file()
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+                if progress:
+                    progress(written, total)
+        local_filename = store.ingest(temp_path, original_name, digest.hexdigest(), source, remote_id)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+    return local_filename, written
+
+def response_filename(response):
+    """Return the file name from the Content-Disposition header, or a generated one"""
+    content_disposition = response.headers.get('Content-Disposition', '')
+    filename = None
+    
+    if 'filename=' in content_disposition:
+        # Extract filename from header
+        filename = re.findall('filename="(.+)"', content_disposition)
+        if filename:
+            filename = filename[0]
+    
+    if not filename:
+        # Generate a filename based on timestamp if none is provided
+        ext = mimetypes.guess_extension(response.headers.get('Content-Type', ''))
+        filename = f"image_{int(time.time())}{ext or '.jpg'}"
+    return filename
+
+class SyncNotSupported(Exception):
+    """The server does not offer the acknowledged sync endpoints"""
+
+class SyncClient:
+    """Resumable, acknowledged sync against the pendingImages and ackImages endpoints.
+    Images are only acknowledged after they were received completely and their size and hash
+    match, so a dropped connection never loses a photo. Interrupted downloads are resumed with
+    HTTP Range requests. The page cursor and unsent acknowledgements survive restarts in
+    SYNC_STATE_FILE.
+    With a display_size the server is asked for pre-scaled, pre-oriented renditions; originals
+    stay available through fetch_original."""
+    def __init__(self, api, store, display_size=None, state_file=SYNC_STATE_FILE):
+        self.api = api
+        self.store = store
+        self.display_size = display_size
+        self.state_file = state_file
+        self.lock = threading.Lock()
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            state = {}
+        state.setdefault('cursor', 0)
+        state.setdefault('unacked', [])
+        return state
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        temp_path = self.state_file + '.tmp'
+        with self.lock:
+            with open(temp_path, 'w') as f:
+                json.dump(self.state, f)
+        os.replace(temp_path, self.state_file)
+
+    def rendition_params(self):
+        """Query parameters advertising this frame's display to the download endpoints"""
+        if not SYNC_RENDITIONS or not self.display_size:
+            return {}
+        width, height = self.display_size
+        return {"width": width, "height": height, "format": RENDITION_FORMAT}
+
+    def sync(self):
+        """Fetch every pending image and return the local paths of the new ones"""
+        received = []
+        self.flush_acks()
+
+        while True:
+            params = {"after": self.state['cursor'], "limit": SYNC_PAGE_SIZE}
+            params.update(self.rendition_params())
+            response = self.api.get("pendingImages", params=params)
+            if response.status_code == 404:
+                raise SyncNotSupported()
+            response.raise_for_status()
+            page = response.json().get('images', [])
+            if not page:
+                # Pass complete, images that failed verification are retried from the start next time
+                self.state['cursor'] = 0
+                self.save_state()
+                break
+
+            with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download") as executor:
+                for img, local_filename in zip(page, executor.map(self.fetch, page)):
+                    if local_filename:
+                        received.append(local_filename)
+                        with self.lock:
+                            self.state['unacked'].append(img['id'])
+
+            self.state['cursor'] = page[-1]['id']
+            self.save_state()
+            self.flush_acks()
+
+        return received
+
+    def partial_path(self, img):
+        return os.path.join(self.store.image_dir, f".sync-{img['id']}.part")
+
+    def fetch(self, img):
+        """Download one image, resuming a previous partial download. Returns the local path
+        once the file is complete and verified, None otherwise."""
+        filename = os.path.basename(img.get('original_filename') or img['url'])
+        partial_path = self.partial_path(img)
+        expected_size = img.get('size')
+
+        try:
+            offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+            if expected_size is None or offset < expected_size:
+                headers = {'Range': f"bytes={offset}-"} if offset else {}
+                with self.api.get(self.api.file_url(img['url']), headers=headers, stream=True) as response:
+                    if response.status_code == 206:
+                        mode = 'ab'
+                    elif response.status_code == 200:
+                        # Server ignored the range, start over
+                        mode = 'wb'
+                    elif response.status_code == 416:
+                        # The partial file no longer matches the original
+                        os.unlink(partial_path)
+                        return None
+                    else:
+                        print(f"Error downloading {filename}: HTTP {response.status_code}")
+                        return None
+                    progress = DownloadProgress(filename)
+                    written = 0
+                    with open(partial_path, mode) as f:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            f.write(chunk)
+                            written += len(chunk)
+                    progress.done(written)
+        except Exception as e:
+            print(f"Download of {filename} interrupted, will resume later: {str(e)}")
+            return None
+
+        digest = self.verify(img, partial_path)
+        if not digest:
+            print(f"Verification failed for {filename}, downloading it again next time")
+            os.unlink(partial_path)
+            return None
+
+        if img.get('rendition'):
+            # Renditions may be in a different format than the original
+            return self.store.ingest(partial_path, filename, digest, source='rendition',
+                                     remote_id=img['id'], ext=os.path.splitext(img['url'])[1])
+        return self.store.ingest(partial_path, filename, digest, source='sync', remote_id=img['id'])
+
+    def fetch_original(self, remote_id):
+        """Download the full original of an image on demand and return its local path"""
+        with self.api.get("download", params={"ids": remote_id}, stream=True) as response:
+            response.raise_for_status()
+            filename = response_filename(response)
+            progress = DownloadProgress(filename)
+            local_filename, written = save_response(
+                response, self.store, filename, progress, source='original', remote_id=remote_id)
+            progress.done(written)
+        return local_filename
+
+    @staticmethod
+    def verify(img, path):
+        """Return the file's SHA-256 if it matches the expected size and hash, else None"""
+        if img.get('size') is not None and os.path.getsize(path) != img['size']:
+            return None
+        digest = PhotoStore.hash_file(path)
+        if img.get('sha256') and digest != img['sha256']:
+            return None
+        return digest
+
+    def flush_acks(self):
+        """Tell the server which images arrived, keeping them queued if that fails"""
+        with self.lock:
+            ids = list(self.state['unacked'])
+        if not ids:
+            return
+        try:
+            response = self.api.post("ackImages", json={"ids": ids})
+            response.raise_for_status()
+        except Exception as e:
+            print(f"Error acknowledging images, retrying later: {str(e)}")
+            return
+        with self.lock:
+            self.state['unacked'] = [image_id for image_id in self.state['unacked'] if image_id not in ids]
+        self.save_state()
+
+class SyncScheduler:
+    """Decides when the next scheduled sync runs.
+    The poll interval doubles after every sync that brings nothing new and drops back to
+    min_interval as soon as images arrive. No scheduled polls run during quiet hours or
+    while the downloads of the last hour exceed the byte cap. Before a scheduled sync the
+    server is probed with a conditional pendingCount request, which costs a 304 when
+    nothing changed. While the last sync left reported images behind the probe is skipped,
+    a 304 would only confirm that they are still waiting."""
+    def __init__(self, api, min_interval=SYNC_MIN_INTERVAL, max_interval=SYNC_MAX_INTERVAL,
+                 quiet_hours=SYNC_QUIET_HOURS, hourly_byte_cap=SYNC_HOURLY_BYTE_CAP):
+        self.api = api
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.quiet_hours = quiet_hours
+        self.hourly_byte_cap = hourly_byte_cap
+        self.interval = min_interval
+        self.transfers = deque()  # (time, bytes) of syncs in the last hour
+        self.etag = None
+        self.pending = 0  # images the last probe reported that no sync has brought yet
+        self.work_left = False
+
+    def in_quiet_hours(self, now):
+        if not self.quiet_hours:
+            return False
+        start, end = self.quiet_hours
+        if start <= end:
+            return start <= now.hour < end
+        # The window wraps around midnight
+        return now.hour >= start or now.hour < end
+
+    def seconds_until_quiet_end(self, now):
+        if not self.in_quiet_hours(now):
+            return 0
+        end = now.replace(hour=self.quiet_hours[1], minute=0, second=0, microsecond=0)
+        if end <= now:
+            end += timedelta(days=1)
+        return (end - now).total_seconds()
+
+    def bytes_last_hour(self, now=None):
+        now = time.time() if now is None else now
+        while self.transfers and self.transfers[0][0] <= now - 3600:
+            self.transfers.popleft()
+        return sum(transferred for _, transferred in self.transfers)
+
+    def seconds_until_bandwidth_available(self, now=None):
+        if self.hourly_byte_cap is None:
+            return 0
+        now = time.time() if now is None else now
+        excess = self.bytes_last_hour(now) - self.hourly_byte_cap
+        if excess < 0:
+            return 0
+        # Wait until enough of the oldest transfers have aged out of the window
+        for timestamp, transferred in self.transfers:
+            excess -= transferred
+            if excess < 0:
+                return max(0, timestamp + 3600 - now)
+        return 0
+
+    def hold_delay(self):
+        """Seconds that quiet hours or the byte cap still hold every sync back, 0 if none"""
+        return max(self.seconds_until_quiet_end(datetime.now()), self.seconds_until_bandwidth_available())
+
+    def next_delay(self):
+        """Seconds until the next scheduled sync"""
+        return max(self.interval, self.hold_delay())
+
+    def probe(self):
+        """Ask the server whether anything is waiting. Returns False when nothing changed
+        since the last probe, True when there are images and None when the server cannot
+        tell, in which case a full sync should run."""
+        headers = {'If-None-Match': self.etag} if self.etag else {}
+        try:
+            response = self.api.get("pendingCount", headers=headers)
+        except Exception as e:
+            print(f"Error probing for new images: {str(e)}")
+            return None
+        if response.status_code == 304:
+            return False
+        if response.status_code != 200:
+            return None
+        self.etag = response.headers.get('ETag')
+        self.pending = response.json().get('count', 0)
+        return self.pending > 0
+
+    def nothing_new(self):
+        """True when a scheduled sync can be skipped"""
+        return not self.work_left and self.probe() is False
+
+    def record(self, new_images, transferred, failed=False):
+        """Adapt the interval to the outcome of a sync"""
+        if transferred:
+            self.transfers.append((time.time(), transferred))
+        self.pending = max(0, self.pending - new_images)
+        self.work_left = failed or self.pending > 0
+        if new_images:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * 2, self.max_interval)
+
+class SyncWorker(threading.Thread):
+    """Runs image syncs on a background thread so the slideshow keeps its schedule.
+    Syncs run when requested and, while active, whenever the scheduler says so. The sync
+    callable returns the number of new images."""
+    def __init__(self, sync, scheduler):
+        super().__init__(daemon=True, name="sync-worker")
+        self.sync = sync
+        self.scheduler = scheduler
+        self.active = False
+        self.wake = threading.Event()
+
+    def notify(self):
+        """A new share was announced. Sync right away, unless quiet hours or the byte cap
+        hold syncs back; then the first scheduled sync afterwards picks the share up."""
+        if self.scheduler.hold_delay():
+            self.scheduler.interval = self.scheduler.min_interval
+            return
+        self.wake.set()
+
+    def set_active(self, active):
+        """Turn the periodic syncs on or off"""
+        self.active = active
+        if active:
+            self.wake.set()
+
+    def run(self):
+        while True:
+            requested = self.wake.wait(self.scheduler.next_delay() if self.active else None)
+            self.wake.clear()
+            if not requested and not self.active:
+                continue
+            # Scheduled syncs only run when the probe does not rule out new images
+            if not requested and self.scheduler.nothing_new():
+                self.scheduler.record(0, 0)
+                continue
+
+            received = self.scheduler.api.bytes_received
+            new_images = 0
+            failed = False
+            try:
+                new_images = self.sync() or 0
+            except Exception as e:
+                print(f"Error during sync: {str(e)}")
+                failed = True
+            self.scheduler.record(new_images, self.scheduler.api.bytes_received - received, failed)
+
+class NotificationListener(threading.Thread):
+    """Keeps a waitForImages long-poll open while active and calls on_new_images as soon
+    as the server reports a new share. Servers without the endpoint answer 404, then the
+    listener stops and the sync worker's scheduled polls carry on alone. With a scheduler
+    the long-poll pauses during its quiet hours."""
+    def __init__(self, api, on_new_images, scheduler=None, wait=NOTIFY_WAIT):
+        super().__init__(daemon=True, name="notification-listener")
+        self.api = api
+        self.on_new_images = on_new_images
+        self.scheduler = scheduler
+        self.wait = wait
+        self.since = 0  # newest share marker seen so far
+        self.active = False
+        self.wake = threading.Event()
+
+    def set_active(self, active):
+        self.active = active
+        if active:
+            self.wake.set()
+
+    def run(self):
+        while True:
+            if not self.active:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            quiet = self.scheduler.seconds_until_quiet_end(datetime.now()) if self.scheduler else 0
+            if quiet:
+                self.wake.wait(quiet)
+                self.wake.clear()
+                continue
+
+            try:
+                response = self.api.get(
+                    "waitForImages", params={'since': self.since, 'timeout': self.wait},
+                    timeout=(API_CONNECT_TIMEOUT, self.wait + API_READ_TIMEOUT))
+            except Exception as e:
+                print(f"Error waiting for new images: {str(e)}")
+                time.sleep(NOTIFY_RETRY_DELAY)
+                continue
+
+            if response.status_code == 404:
+                print("Server has no long-poll endpoint, relying on scheduled syncs")
+                return
+            if response.status_code != 200:
+                time.sleep(NOTIFY_RETRY_DELAY)
+                continue
+
+            try:
+                data = response.json()
+            except ValueError:
+                # E.g. a captive portal or proxy error page
+                print("Unexpected answer while waiting for new images, retrying later")
+                time.sleep(NOTIFY_RETRY_DELAY)
+                continue
+            self.since = max(self.since, data.get('latest', 0))
+            if data.get('changed') and self.active:
+                self.on_new_images()
+
+class BearerAuth:
+    """Adds the current session token to every request, requests accepts any callable as auth"""
+    def __init__(self, get_token):
+        self.get_token = get_token
+
+    def __call__(self, request):
+        token = self.get_token()
+        if token:
+            request.headers['Authorization'] = f"Bearer {token}"
+        return request
+
+class ApiClient:
+    """Single pooled HTTP session used for every call to the server.
+    Keeps connections alive between requests, applies timeouts to every call and retries
+    failed connections and server errors with exponential backoff. The session is created on
+    first use, so importing requests does not delay the first photo at startup."""
+    def __init__(self, get_token, base_url=SERVER_BASE_URL):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api.php"
+        self.timeout = (API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+        self.get_token = get_token
+        self._session = None
+        self.session_lock = threading.Lock()
+
+        # Count downloaded bytes for the sync scheduler's bandwidth cap
+        self.bytes_received = 0
+        self.bytes_lock = threading.Lock()
+
+    @property
+    def session(self):
+        with self.session_lock:
+            if self._session is None:
+                self._session = self.create_session()
+            return self._session
+
+    def create_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=API_RETRIES,
+            backoff_factor=API_BACKOFF,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_POOL_SIZE, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.auth = BearerAuth(self.get_token)
+        session.hooks['response'].append(self.count_bytes)
+        return session
+
+    def count_bytes(self, response, *args, **kwargs):
+        length = response.headers.get('Content-Length')
+        if length and length.isdigit():
+            with self.bytes_lock:
+                self.bytes_received += int(length)
+        # Time until the response headers arrived, bodies are streamed afterwards
+        metrics.observe('http_request_seconds', response.elapsed.total_seconds())
+
+    def url(self, path):
+        """API endpoints are given by name, anything else relative to the server base URL"""
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f"{self.api_url}/{path}"
+
+    def file_url(self, path):
+        return f"{self.base_url}/{path}"
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.request(method, self.url(path), **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
 class OnScreenKeyboard:
     def __init__(self, master=None):
         self.master = master
@@ -166,8 +2361,61 @@ class OnScreenKeyboard:
                     else:
                         child.config(bg='#ADD8E6')
 
+def process_uptime():
+    """Return (seconds since this process started, seconds since boot), None where unknown"""
+    try:
+        with open('/proc/uptime') as f:
+            system = float(f.read().split()[0])
+        with open('/proc/self/stat') as f:
+            # Field 22 is the start time in clock ticks after boot, the command name before it may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        return system - start_ticks / os.sysconf('SC_CLK_TCK'), system
+    except (OSError, ValueError, IndexError):
+        return None, None
+
+class StartupTimeline:
+    """Prints when each startup step finished, counted from process start so interpreter
+    startup and imports are included, and keeps the last timelines in STARTUP_LOG_FILE"""
+    def __init__(self, log_file=STARTUP_LOG_FILE):
+        self.log_file = log_file
+        since_process, self.boot_uptime = process_uptime()
+        self.start = time.monotonic() - since_process if since_process is not None else MODULE_LOADED
+        self.steps = []
+        self.saved = False
+        if self.boot_uptime is not None:
+            print(f"Startup: process started {self.boot_uptime - since_process:.1f}s after boot")
+
+    def mark(self, step):
+        elapsed = time.monotonic() - self.start
+        self.steps.append((step, round(elapsed, 3)))
+        print(f"Startup: {step} after {elapsed:.2f}s")
+
+    def save(self):
+        """Append this timeline to the log once, keeping the last STARTUP_LOG_KEEP entries"""
+        if self.saved:
+            return
+        self.saved = True
+        entry = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'boot_uptime': self.boot_uptime,
+            'steps': dict(self.steps),
+        }
+        try:
+            lines = []
+            if os.path.exists(self.log_file):
+                with open(self.log_file, 'r') as f:
+                    lines = f.readlines()
+            lines = lines[-(STARTUP_LOG_KEEP - 1):] + [json.dumps(entry) + '\n']
+            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+            with open(self.log_file, 'w') as f:
+                f.writelines(lines)
+        except OSError as e:
+            print(f"Error writing startup log: {str(e)}")
+
 class MagicFrameApp:
     def __init__(self, root):
+        self.timeline = StartupTimeline()
+        self.timeline.mark("modules loaded")
         self.root = root
         self.root.title("Magic Photo Frame!")
         self.root.attributes('-fullscreen', True)
@@ -179,15 +2427,80 @@ class MagicFrameApp:
         self.is_online_mode = False
         self.slideshow_running = False
         self.slideshow_thread = None
-        self.images = []
-        self.current_image_index = 0
+        self.playback = PlaybackScheduler()
         self.check_new_images_thread = None
+        self.prefetcher = None
+        self.next_slide_due = None
+        self.transitions = None
+        self.transition_job = None  # pending step of the transition being played
+        self.transition_prepare_job = None  # pending retry of prepare_transition
+        self.shown_path = None
+        self.shown_image = None
+        self.last_shown_saved = None
+        self.render_cache = RenderCache()
+        self.library = LibraryIndex()
+        self.library_loaded = False
+        self.frame_cache = FrameCache()
+        self.frame_store = None
+        self.renderer = None
+        self.api = ApiClient(lambda: self.token)
+        self.store = PhotoStore(self.library)
+        self.display_size = (self.root.winfo_screenwidth(), self.root.winfo_screenheight())
+        self.sync_client = SyncClient(self.api, self.store, self.display_size)
+        self.storage = StorageManager(self.library, self.store, self.display_size,
+                                      self.sync_client.fetch_original, self.render_cache)
+        self.sync_scheduler = SyncScheduler(self.api)
+        self.sync_worker = SyncWorker(self.check_for_new_images, self.sync_scheduler)
+        self.sync_worker.start()
+        self.notifier = None
+        if NOTIFY_ENABLED:
+            self.notifier = NotificationListener(self.api, self.sync_worker.notify, self.sync_scheduler)
+            self.notifier.start()
+        if metrics.enabled:
+            MetricsReporter(metrics).start()
+
+        # Background threads hand results to the Tk thread through this queue
+        self.ui_queue = queue.Queue()
+        self.root.after(UI_QUEUE_POLL_INTERVAL, self.process_ui_queue)
+
+        # Pick up photos copied onto the frame directly, e.g. via USB or SCP
+        self.watcher = ImageDirWatcher(IMAGE_DIR, self.on_image_dir_change)
+        self.watcher.start()
         
         # Load saved config if exists
         self.load_config()
         
-        # Create UI
-        self.setup_ui()
+        if FAST_START and self.token:
+            # Put a photo up before anything else, the menu is built behind it
+            self.resume_slideshow()
+        else:
+            # Create UI
+            self.setup_ui()
+            self.timeline.mark("menu shown")
+            self.timeline.save()
+
+    def run_on_ui_thread(self, func, *args):
+        """Schedule func(*args) on the Tk thread, safe to call from any thread"""
+        self.ui_queue.put((func, args))
+
+    def process_ui_queue(self):
+        while True:
+            try:
+                func, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"Error handling background result: {str(e)}")
+        self.root.after(UI_QUEUE_POLL_INTERVAL, self.process_ui_queue)
+
+    def on_image_dir_change(self, added, removed):
+        # Called on the watcher thread
+        if removed:
+            self.run_on_ui_thread(self.remove_images, removed)
+        if added:
+            self.add_new_images(added)
         
     def load_config(self):
         if os.path.exists(CONFIG_FILE):
@@ -277,7 +2590,7 @@ class MagicFrameApp:
     def start_offline_mode(self):
         self.is_online_mode = False
         self.load_local_images()
-        if self.images:
+        if self.playback:
             self.start_slideshow()
         else:
             self.show_message("No Images", "No images found locally. Please download images first.")
@@ -364,11 +2677,7 @@ class MagicFrameApp:
         
         try:
             # Call server logout endpoint
-            headers = {"Authorization": f"Bearer {self.token}"}
-            response = requests.post(
-                f"{API_URL}/logout",
-                headers=headers
-            )
+            response = self.api.post("logout")
             
             if response.status_code == 200:
                 # Server-side logout successful
@@ -384,10 +2693,6 @@ class MagicFrameApp:
                     if hasattr(self, 'slideshow_running') and self.slideshow_running:
                         self.stop_slideshow()
                     
-                    # Hide active frames
-                    if hasattr(self, 'slideshow_frame') and self.slideshow_frame:
-                        self.slideshow_frame.pack_forget()
-                    
                     # Show login screen
                     self.show_login_screen()
                     
@@ -422,8 +2727,8 @@ class MagicFrameApp:
             return
         
         try:
-            response = requests.post(
-                f"{API_URL}/login", 
+            response = self.api.post(
+                "login",
                 json={"username": username, "password": password}
             )
             
@@ -438,7 +2743,6 @@ class MagicFrameApp:
                     # Go to slideshow
                     self.login_frame.pack_forget()
                     self.load_local_images()
-                    self.check_for_new_images()
                     self.start_slideshow()
                 else:
                     self.show_message("Error", "Invalid response from server")
@@ -453,15 +2757,87 @@ class MagicFrameApp:
         except Exception as e:
             self.show_message("Connection Error", f"Failed to connect to server: {str(e)}")
     
+    def resume_slideshow(self):
+        """Start straight into the slideshow with the saved login. The photo from before the
+        restart is shown first, the menu and library are loaded after it and the login is
+        checked in the background."""
+        self.is_online_mode = True
+        self.renderer = self.create_renderer()
+        self.show_last_shown()
+        self.root.after_idle(self.finish_resume)
+
+    def finish_resume(self):
+        self.timeline.mark("first photo" if self.shown_path else "slideshow opened")
+        self.setup_ui()
+        # Build the menu for later but keep it hidden behind the slideshow
+        self.main_frame.pack_forget()
+        self.timeline.mark("menu built")
+        self.load_local_images()
+        self.timeline.mark("library loaded")
+        self.start_slideshow()
+        self.timeline.mark("slideshow running")
+        threading.Thread(target=self.verify_token_in_background, daemon=True).start()
+
+    def show_last_shown(self):
+        """Show the photo that was on screen before the restart, usually from the render cache"""
+        try:
+            with open(LAST_SHOWN_FILE, 'r') as f:
+                image_path = json.load(f).get('path')
+            if not image_path or not os.path.exists(image_path):
+                return
+            image = self.render_cache.load(image_path, *self.display_size)
+            self.renderer.show(self.renderer.make_frame(image))
+        except Exception as e:
+            print(f"Error showing last photo: {str(e)}")
+            return
+        self.shown_path = image_path
+        self.shown_image = image
+
+    def save_last_shown(self, image_path):
+        """Remember the photo on screen for the next start, at most every LAST_SHOWN_SAVE_INTERVAL"""
+        now = time.monotonic()
+        if self.last_shown_saved is not None and now - self.last_shown_saved < LAST_SHOWN_SAVE_INTERVAL:
+            return
+        self.last_shown_saved = now
+        temp_path = LAST_SHOWN_FILE + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'path': image_path}, f)
+            os.replace(temp_path, LAST_SHOWN_FILE)
+        except OSError as e:
+            print(f"Error saving last photo: {str(e)}")
+
+    def verify_token_in_background(self):
+        """Check the saved login while the slideshow runs. Only a rejected token leads back
+        to the login screen, without a connection the slideshow goes on with local images."""
+        try:
+            response = self.api.get("images")
+        except Exception as e:
+            print(f"Could not verify login: {str(e)}")
+            self.timeline.save()
+            return
+        if response.status_code in (401, 403):
+            self.run_on_ui_thread(self.login_expired)
+        else:
+            self.timeline.mark("login verified")
+        self.timeline.save()
+
+    def login_expired(self):
+        self.token = None
+        self.user_id = None
+        self.username = None
+        self.save_config()
+        if self.slideshow_running:
+            self.stop_slideshow()
+        self.show_login_screen()
+
     def verify_token(self):
         try:
-            headers = {"Authorization": f"Bearer {self.token}"}
-            response = requests.get(f"{API_URL}/images", headers=headers)
+            response = self.api.get("images")
             
             if response.status_code == 200:
                 # Token is valid, proceed with slideshow
                 self.load_local_images()
-                self.check_for_new_images()
                 self.start_slideshow()
             else:
                 # Invalid token, show login screen
@@ -485,263 +2861,450 @@ class MagicFrameApp:
         self.main_frame.pack(fill=tk.BOTH, expand=True)
     
     def load_local_images(self):
-        self.images = []
-        for filename in os.listdir(IMAGE_DIR):
-            ext = os.path.splitext(filename)[1].lower()
-            if ext in SUPPORTED_FORMATS:
-                self.images.append(os.path.join(IMAGE_DIR, filename))
-        
-        # Randomize images order
-        random.shuffle(self.images)
+        # The directory is only walked once per run, afterwards new files are added to the
+        # index as they arrive and the play order is kept
+        if self.library_loaded:
+            return
+        self.library.reconcile()
+        self.playback.load(self.library.entries())
+        self.library_loaded = True
+
+    def add_new_images(self, image_paths):
+        """Index newly arrived files and queue them for the slideshow. Safe to call from any
+        thread, the header reads happen on the caller's thread."""
+        changed = [image_path for image_path in image_paths if self.library.add(image_path)]
+        if changed:
+            self.run_on_ui_thread(self.splice_new_images, changed)
+
+    def splice_new_images(self, image_paths):
+        """Queue new images so they are shown after the ones already being prepared"""
+        self.playback.add(image_paths)
+
+    def remove_images(self, image_paths):
+        """Forget deleted files and drop them from the play order"""
+        for image_path in image_paths:
+            self.library.remove(image_path)
+            self.playback.remove(image_path)
     
     def check_for_new_images(self):
+        """Download new images from the server and return how many arrived, keeping the
+        photos within the storage budget before and after. Runs on the sync worker thread."""
         if not self.is_online_mode or not self.token:
-            return
+            return 0
+        self.storage.enforce()
+        new_images = self.sync_new_images()
+        self.storage.enforce()
+        return new_images
+
+    def sync_new_images(self):
+        """Download new images and return how many files arrived. Counted separately from
+        the index, the directory watcher may have indexed them already during a long sync."""
+        # Prefer the acknowledged protocol, older servers only have notDownloadedImages
+        try:
+            received = self.sync_client.sync()
+            self.add_new_images(received)
+            return len(received)
+        except SyncNotSupported:
+            pass
+        except Exception as e:
+            print(f"Error syncing images: {str(e)}")
+            return 0
         
         try:
-            headers = {"Authorization": f"Bearer {self.token}"}
-            response = requests.get(f"{API_URL}/notDownloadedImages?download=true", headers=headers, stream=True)
-            
-            if response.status_code == 200:
-                # Check content type to determine if we got JSON or files
-                content_type = response.headers.get('Content-Type', '')
+            params = {"download": "true"}
+            params.update(self.sync_client.rendition_params())
+            with self.api.get("notDownloadedImages", params=params, stream=True) as response:
+                if response.status_code == 200:
+                    # Check content type to determine if we got JSON or files
+                    content_type = response.headers.get('Content-Type', '')
                 
-                if 'application/json' in content_type:
-                    # Handle JSON response (no new images or keeping compatibility)
-                    data = response.json()
+                    if 'application/json' in content_type:
+                        # Handle JSON response (no new images or keeping compatibility)
+                        data = response.json()
                     
-                    # Check if there's a message about no new images
-                    if 'message' in data and 'no new images' in data['message'].lower():
-                        print("No new images to download")
-                    else:
-                        # Process metadata and download images individually (old method)
-                        images = data.get("images", [])
-                        self._process_image_metadata(images)
+                        # Check if there's a message about no new images
+                        if 'message' in data and 'no new images' in data['message'].lower():
+                            print("No new images to download")
+                        else:
+                            # Process metadata and download images individually (old method)
+                            images = data.get("images", [])
+                            return self._process_image_metadata(images)
                 
-                elif 'application/zip' in content_type:
-                    # Handle ZIP file download
-                    self._process_zip_download(response)
+                    elif 'application/zip' in content_type:
+                        # Handle ZIP file download
+                        return self._process_zip_download(response)
                 
-                elif any(img_type in content_type for img_type in ['image/jpeg', 'image/png', 'image/gif']):
-                    # Handle single image download
-                    self._process_single_image_download(response)
+                    elif any(img_type in content_type for img_type in ['image/jpeg', 'image/png', 'image/gif']):
+                        # Handle single image download
+                        return self._process_single_image_download(response)
                 
-                else:
-                    print(f"Unexpected content type: {content_type}")
+                    else:
+                        print(f"Unexpected content type: {content_type}")
                     
         except Exception as e:
             print(f"Error checking for new images: {str(e)}")
-        
-        # Schedule the next check
-        if self.slideshow_running and self.is_online_mode:
-            self.root.after(CHECK_NEW_IMAGES_INTERVAL * 1000, self.check_for_new_images)
+        return 0
 
     def _process_image_metadata(self, images):
-        """Process image metadata and download images individually (original method)"""
-        new_images_added = False
+        """Process image metadata and download the images in parallel"""
+        if not images:
+            return 0
+        new_images = []
+
+        with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS, thread_name_prefix="download") as executor:
+            downloads = [executor.submit(self._download_image, img) for img in images]
+            for download in downloads:
+                local_filename = download.result()
+                if local_filename:
+                    new_images.append(local_filename)
         
-        for img in images:
-            image_url = f"{SERVER_BASE_URL}/{img['url']}"
-            # Set the local filename to the original filename if available
-            local_filename = os.path.join(IMAGE_DIR, img['original_filename'] if 'original_filename' in img else os.path.basename(img['url']))
-            
-            try:
-                # Download the image
-                img_response = requests.get(image_url, stream=True)
+        # Add the new images to the slideshow list
+        self.add_new_images(new_images)
+        return len(new_images)
+
+    def _download_image(self, img):
+        """Download one image from the metadata list, returns its local path or None"""
+        image_url = self.api.file_url(img['url'])
+        # Set the local filename to the original filename if available
+        filename = img['original_filename'] if 'original_filename' in img else os.path.basename(img['url'])
+
+        try:
+            # Download the image
+            with self.api.get(image_url, stream=True) as img_response:
                 if img_response.status_code == 200:
-                    with open(local_filename, 'wb') as f:
-                        for chunk in img_response.iter_content(1024):
-                            f.write(chunk)
-                    
-                    # Add the new image to the slideshow list
-                    self.images.append(local_filename)
-                    new_images_added = True
-            except Exception as e:
-                print(f"Error downloading image {image_url}: {str(e)}")
-        
-        # If we downloaded new images, reload and shuffle the list
-        if new_images_added:
-            self.load_local_images()
+                    progress = DownloadProgress(filename)
+                    local_filename, written = save_response(
+                        img_response, self.store, filename, progress, source='download', remote_id=img.get('id'))
+                    progress.done(written)
+                    return local_filename
+                print(f"Error downloading image {image_url}: HTTP {img_response.status_code}")
+        except Exception as e:
+            print(f"Error downloading image {image_url}: {str(e)}")
+        return None
 
     def _process_zip_download(self, response):
         """Process a ZIP file containing multiple images"""
+        extracted = []
+        try:
+            if ZIP_STREAMING:
+                # Unpack members while the archive is still downloading
+                reader = ZipStreamReader(response.iter_content(chunk_size=ZIP_CHUNK_SIZE))
+                try:
+                    extract_zip_stream(reader, self.store, extracted)
+                except ZipRandomAccessRequired as e:
+                    print(f"Cannot stream ZIP member ({str(e)}), using a temporary file for the rest")
+                    self._extract_zip_via_tempfile([e.header], reader.remaining(), extracted, resumed=True)
+            else:
+                self._extract_zip_via_tempfile([], response.iter_content(chunk_size=8192), extracted)
+        except Exception as e:
+            print(f"Error processing ZIP download: {str(e)}")
+
+        # Add the new images to the slideshow list, including any extracted before an error
+        self.add_new_images([local_filename for _, local_filename in extracted])
+        return len(extracted)
+
+    def _extract_zip_via_tempfile(self, head, chunks, extracted, resumed=False):
+        """Write the archive to a temporary file and extract it with zipfile.
+        When resumed the file starts in the middle of the archive, at the member streaming
+        gave up on. zipfile places the members before that point, which were already
+        extracted, at negative offsets, so they are skipped by position, not by name."""
+        # Create a temporary file to store the ZIP
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
+            # Write the ZIP content to the temporary file
+            for chunk in head:
+                temp_file.write(chunk)
+            for chunk in chunks:
+                temp_file.write(chunk)
+            temp_file_path = temp_file.name
+        
         try:
-            # Create a temporary file to store the ZIP
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_file:
-                # Write the ZIP content to the temporary file
-                for chunk in response.iter_content(chunk_size=8192):
-                    temp_file.write(chunk)
-                temp_file_path = temp_file.name
-            
             # Process the ZIP file
-            new_images_added = False
             with zipfile.ZipFile(temp_file_path, 'r') as zip_ref:
                 # Extract all images
                 for file_info in zip_ref.infolist():
                     if not file_info.is_dir():
+                        if resumed and file_info.header_offset < 0:
+                            continue
                         # Get the filename without path
                         filename = os.path.basename(file_info.filename)
-                        local_filename = os.path.join(IMAGE_DIR, filename)
                         
-                        # Extract the file
-                        with zip_ref.open(file_info) as source, open(local_filename, 'wb') as target:
-                            shutil.copyfileobj(source, target)
+                        # Extract the file, moving it into the store once complete
+                        start = time.perf_counter()
+                        fd, temp_path = self.store.temp_file()
+                        try:
+                            with zip_ref.open(file_info) as source, os.fdopen(fd, 'wb') as target:
+                                shutil.copyfileobj(source, target)
+                            local_filename = self.store.ingest(temp_path, filename, source='zip')
+                        finally:
+                            if os.path.exists(temp_path):
+                                os.unlink(temp_path)
+                        metrics.observe('zip_extract_seconds', time.perf_counter() - start)
                         
-                        # Add to slideshow list
-                        self.images.append(local_filename)
-                        new_images_added = True
-            
+                        extracted.append((filename, local_filename))
+        finally:
             # Delete the temporary ZIP file
             os.unlink(temp_file_path)
-            
-            # If we added new images, reload and shuffle the list
-            if new_images_added:
-                self.load_local_images()
-                
-        except Exception as e:
-            print(f"Error processing ZIP download: {str(e)}")
 
     def _process_single_image_download(self, response):
         """Handle a single image download"""
         try:
             # Get filename from Content-Disposition header if available
-            content_disposition = response.headers.get('Content-Disposition', '')
-            filename = None
-            
-            if 'filename=' in content_disposition:
-                # Extract filename from header
-                filename = re.findall('filename="(.+)"', content_disposition)
-                if filename:
-                    filename = filename[0]
-            
-            if not filename:
-                # Generate a filename based on timestamp if none is provided
-                ext = mimetypes.guess_extension(response.headers.get('Content-Type', ''))
-                filename = f"image_{int(time.time())}{ext or '.jpg'}"
+            filename = response_filename(response)
             
             # Save the image
-            local_filename = os.path.join(IMAGE_DIR, filename)
-            with open(local_filename, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=1024):
-                    f.write(chunk)
+            progress = DownloadProgress(filename)
+            local_filename, written = save_response(response, self.store, filename, progress, source='download')
+            progress.done(written)
             
-            # Add to slideshow and reload
-            self.images.append(local_filename)
-            self.load_local_images()
+            # Add to slideshow
+            self.add_new_images([local_filename])
+            return 1
             
         except Exception as e:
             print(f"Error processing single image download: {str(e)}")
+            return 0
     
     def start_slideshow(self):
-        if not self.images:
+        # In online mode the first sync may still bring in images, so start anyway
+        if not self.playback and not self.is_online_mode:
             self.show_message("No Images", "No images found. Please add images to the folder.")
             self.back_to_main()
             return
         
-        # Hide all frames
-        for widget in self.root.winfo_children():
-            if isinstance(widget, tk.Toplevel):
-                widget.withdraw()
-            else:
-                widget.pack_forget()
-        
-        # Create slideshow frame
-        self.slideshow_frame = tk.Frame(self.root, bg='black')
-        self.slideshow_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Image label
-        self.image_label = tk.Label(self.slideshow_frame, bg='black')
-        self.image_label.pack(fill=tk.BOTH, expand=True)
-        
-        # Bind click events to exit slideshow
-        self.slideshow_frame.bind("<Button-1>", self.stop_slideshow)
-        self.image_label.bind("<Button-1>", self.stop_slideshow)
+        # Open the display, unless resume_slideshow already did
+        if self.renderer is None:
+            # Hide all frames
+            for widget in self.root.winfo_children():
+                if isinstance(widget, tk.Toplevel):
+                    widget.withdraw()
+                else:
+                    widget.pack_forget()
+
+            self.renderer = self.create_renderer()
+            self.shown_path = None
+            self.shown_image = None
         
+        # Start preparing images in the background
+        if self.prefetcher is None:
+            self.prefetcher = ImagePrefetcher(*self.display_size, render_cache=self.render_cache, library=self.library)
+        if self.frame_store is None and FRAME_STORE:
+            try:
+                self.frame_store = MmapFrameStore(FRAME_STORE_FILE, *self.display_size)
+            except (OSError, ValueError) as e:
+                print(f"Error opening frame store: {str(e)}")
+        if self.transitions is None and TRANSITION != "cut":
+            self.transitions = TransitionEngine(*self.display_size, self.prefetcher.load_image)
+
         # Start slideshow
         self.slideshow_running = True
-        self.current_image_index = 0
-        self.show_next_image()
+        self.next_slide_due = None
+        if self.shown_path:
+            # The photo from before the restart is already up, give it a full slot
+            self.next_slide_due = time.monotonic() + SLIDESHOW_DELAY
+            self.prefetcher.prefetch(self.images_to_prefetch())
+            self.prepare_transition()
+            self.root.after(SLIDESHOW_DELAY * 1000, self.show_next_image)
+        else:
+            self.show_next_image()
         
-        # If in online mode, periodically check for new images
+        # If in online mode, sync now and then whenever new images are shared or the scheduler says so
         if self.is_online_mode:
-            self.root.after(CHECK_NEW_IMAGES_INTERVAL * 1000, self.check_for_new_images)
+            self.sync_worker.set_active(True)
+            if self.notifier:
+                self.notifier.set_active(True)
     
+    def create_renderer(self):
+        """Open the configured renderer, falling back to Tk when pygame cannot start"""
+        if RENDERER == "pygame":
+            renderer = PygameRenderer(self.root, self.stop_slideshow)
+            if renderer.open():
+                return renderer
+            print("Falling back to the Tk renderer")
+        renderer = TkRenderer(self.root, self.stop_slideshow)
+        renderer.open()
+        return renderer
+
+    def upcoming_images(self):
+        """Return the paths of the next images to show, starting with the current one"""
+        return self.playback.peek(min(PREFETCH_COUNT, len(self.playback)))
+
+    def images_to_prefetch(self):
+        """Upcoming images that are not already waiting in the frame cache or frame store"""
+        upcoming = []
+        for image_path in self.upcoming_images():
+            try:
+                frame_key = self.frame_key(image_path)
+                if frame_key not in self.frame_cache and not (self.frame_store and frame_key in self.frame_store):
+                    upcoming.append(image_path)
+            except OSError:
+                pass
+        return upcoming
+
+    @staticmethod
+    def frame_key(image_path):
+        # Store files are keyed by their content hash
+        digest = PhotoStore.hash_from_path(image_path)
+        if digest:
+            return digest
+        # Include size and mtime so a file replaced under the same name is not shown stale
+        stat = os.stat(image_path)
+        return (image_path, stat.st_size, stat.st_mtime_ns)
+
     def show_next_image(self):
-        if not self.slideshow_running or not self.images:
+        if not self.slideshow_running:
             return
-    
+        if not self.playback:
+            # Wait for the background sync to deliver the first images
+            self.root.after(1000, self.show_next_image)
+            return
+
         try:
             # Get current image path
-            image_path = self.images[self.current_image_index]
-        
-            # Open image
-            image = Image.open(image_path)
-            
-            # Apply EXIF orientation if it exists
-            try:
-                for orientation in ExifTags.TAGS.keys():
-                    if ExifTags.TAGS[orientation] == 'Orientation':
-                        break
-                        
-                exif = image._getexif()
-                if exif is not None and orientation in exif:
-                    if exif[orientation] == 2:
-                        image = image.transpose(Image.FLIP_LEFT_RIGHT)
-                    elif exif[orientation] == 3:
-                        image = image.transpose(Image.ROTATE_180)
-                    elif exif[orientation] == 4:
-                        image = image.transpose(Image.FLIP_TOP_BOTTOM)
-                    elif exif[orientation] == 5:
-                        image = image.transpose(Image.FLIP_LEFT_RIGHT).transpose(Image.ROTATE_90)
-                    elif exif[orientation] == 6:
-                        image = image.transpose(Image.ROTATE_270)
-                    elif exif[orientation] == 7:
-                        image = image.transpose(Image.FLIP_LEFT_RIGHT).transpose(Image.ROTATE_270)
-                    elif exif[orientation] == 8:
-                        image = image.transpose(Image.ROTATE_90)
-            except (AttributeError, KeyError, IndexError):
-                # No EXIF orientation found or other issue, proceed with image as is
-                pass
-            
-            # Get screen dimensions
-            screen_width = self.root.winfo_screenwidth()
-            screen_height = self.root.winfo_screenheight()
-        
-            # Calculate aspect ratio for resizing
-            img_width, img_height = image.size
-            aspect_ratio = img_width / img_height
-        
-            if screen_width / screen_height > aspect_ratio:
-                # Screen is wider than image
-                new_height = screen_height
-                new_width = int(aspect_ratio * new_height)
+            image_path = self.playback.peek(1)[0]
+
+            # Reuse the frame if it was shown recently, otherwise the prefetch
+            # workers decode and resize it
+            frame_key = self.frame_key(image_path)
+            frame = self.frame_cache.get(frame_key)
+            image = None
+            stored = self.frame_store.get(frame_key) if self.frame_store and frame is None else None
+            if stored:
+                # Raw pixels straight from the memory-mapped store. Not kept in the frame
+                # cache, the frame may point into a slot that is reused later.
+                frame = self.renderer.frame_from_buffer(*stored)
+            elif frame is None:
+                self.prefetcher.prefetch(self.images_to_prefetch())
+                image = self.prefetcher.get(image_path)
+                if image is None:
+                    # Not ready yet, keep the current image and check again shortly
+                    self.root.after(PREFETCH_POLL_INTERVAL, self.show_next_image)
+                    return
+
+                with metrics.timed('frame_convert_seconds'):
+                    frame = self.renderer.make_frame(image)
+                self.frame_cache.put(frame_key, frame, self.renderer.frame_bytes(frame))
+                if self.frame_store:
+                    self.frame_store.put(frame_key, image)
+
+            # Update image, through a transition if one was built in time
+            self.stop_transition()
+            frames = None
+            if self.transitions and self.shown_path:
+                frames = self.transitions.take((self.shown_path, image_path))
+            if frames:
+                self.play_transition(frames, frame)
             else:
-                # Screen is taller than image
-                new_width = screen_width
-                new_height = int(new_width / aspect_ratio)
-                
-            image = image.resize((new_width, new_height), Image.LANCZOS)
-            photo = ImageTk.PhotoImage(image)
-            
-            # Update image
-            self.image_label.config(image=photo)
-            self.image_label.image = photo  # Keep reference
-            
-            # Move to next image
-            self.current_image_index = (self.current_image_index + 1) % len(self.images)
-            
-            # Schedule next image
-            self.root.after(SLIDESHOW_DELAY * 1000, self.show_next_image)
+                self.renderer.show(frame)
+            self.shown_path = image_path
+            self.save_last_shown(image_path)
+            self.storage.record_view(image_path)
+            self.shown_image = image
+
+            # Move to next image and start preparing the ones after it
+            self.playback.next()
+            self.prefetcher.prefetch(self.images_to_prefetch())
+            self.prepare_transition()
+            if self.playback.shown % len(self.playback) == 0:
+                print(f"Frame cache: {self.frame_cache.stats()}")
+                if self.transitions:
+                    print(f"Transitions: {self.transitions.stats()}")
+
+            # Schedule next image against a fixed cadence; if this image was late,
+            # give it the full delay instead of cutting it short
+            now = time.monotonic()
+            if self.next_slide_due is None or now - self.next_slide_due > 0.25:
+                self.next_slide_due = now
+            self.next_slide_due += SLIDESHOW_DELAY
+            delay = max(0, int((self.next_slide_due - now) * 1000))
+            self.root.after(delay, self.show_next_image)
         except Exception as e:
             print(f"Error showing image: {str(e)}")
             # Skip to next image
-            self.current_image_index = (self.current_image_index + 1) % len(self.images)
+            self.playback.next()
             self.root.after(100, self.show_next_image)
     
+    def prepare_transition(self):
+        """Start building the transition into the next image once that image is prepared"""
+        self.transition_prepare_job = None
+        if not self.transitions or not self.slideshow_running or not self.playback:
+            return
+        next_path = self.playback.peek(1)[0]
+        if next_path == self.shown_path:
+            return
+
+        target = next_path
+        if next_path in self.prefetcher:
+            # Reuse the prefetched image instead of preparing it twice
+            try:
+                target = self.prefetcher.peek(next_path)
+            except Exception:
+                return
+            if target is None:
+                self.transition_prepare_job = self.root.after(TRANSITION_POLL_INTERVAL, self.prepare_transition)
+                return
+        else:
+            target = self.stored_image(next_path) or next_path
+        source = self.shown_image or self.stored_image(self.shown_path) or self.shown_path
+        self.transitions.prepare((self.shown_path, next_path), source, target)
+
+    def stored_image(self, image_path):
+        """Copy of the image's frame in the frame store, or None"""
+        if self.frame_store:
+            try:
+                return self.frame_store.image(self.frame_key(image_path))
+            except OSError:
+                pass
+        return None
+
+    def play_transition(self, frames, frame, index=0, start=None):
+        """Present transition frames at TRANSITION_FPS and finish on the slide's own frame.
+        Cuts straight to the slide when presenting falls behind."""
+        self.transition_job = None
+        now = time.monotonic()
+        if start is None:
+            start = now
+        interval = 1 / TRANSITION_FPS
+
+        if index < len(frames) and now - (start + index * interval) > TRANSITION_LATE_FRAMES * interval:
+            self.transitions.late += 1
+            index = len(frames)
+        elif index == len(frames):
+            self.transitions.played += 1
+        if index == len(frames):
+            self.renderer.show(frame)
+            return
+
+        presented = time.perf_counter()
+        self.renderer.present(frames[index])
+        self.transitions.record_frame(time.perf_counter() - presented)
+
+        delay = start + (index + 1) * interval - time.monotonic()
+        self.transition_job = self.root.after(
+            max(0, int(delay * 1000)), self.play_transition, frames, frame, index + 1, start)
+
+    def stop_transition(self):
+        """Stop the transition being played and the wait for the next one"""
+        for job in (self.transition_job, self.transition_prepare_job):
+            if job:
+                self.root.after_cancel(job)
+        self.transition_job = None
+        self.transition_prepare_job = None
+
     def stop_slideshow(self, event=None):
         self.slideshow_running = False
-        if hasattr(self, 'slideshow_frame'):
-            self.slideshow_frame.pack_forget()
+        self.stop_transition()
+        if self.transitions:
+            self.transitions.cancel()
+        self.sync_worker.set_active(False)
+        if self.notifier:
+            self.notifier.set_active(False)
+        if self.prefetcher:
+            self.prefetcher.prefetch([])
+        if self.renderer:
+            self.renderer.close()
+            self.renderer = None
+            # Frames belong to the renderer that made them
+            self.frame_cache.clear()
         self.back_to_main()
     
     def setup_wifi(self):
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Fill the render cache with screen-sized copies of a directory of images.
+
+The slideshow otherwise renders each image the first time it is shown. Run this on a
+desktop to pre-warm the cache before shipping a frame (then copy the cache directory to
+~/.magicframe_cache/renders on the Pi), or on the Pi after changing the display resolution.
+Entries are keyed by file content, screen size and filter, images that are already cached
+are skipped.
+
+Usage:
+    python3 prerender.py ~/slideshow_images --width 1024 --height 600
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from loginscript import IMAGE_DIR, RENDER_CACHE_DIR, RENDER_CACHE_MAX_BYTES, SUPPORTED_FORMATS, RenderCache, prepare_image
+
+# Each worker process keeps its own RenderCache, set up by init_worker
+render_cache = None
+
+
+def find_images(directory):
+    images = []
+    for entry in sorted(os.scandir(directory), key=lambda entry: entry.name):
+        # Hidden files are partial downloads and temporary files of the photo store
+        if entry.is_file() and not entry.name.startswith('.') \
+                and os.path.splitext(entry.name)[1].lower() in SUPPORTED_FORMATS:
+            images.append(entry.path)
+    return images
+
+
+def init_worker(cache_dir, max_bytes):
+    global render_cache
+    render_cache = RenderCache(cache_dir, max_bytes)
+
+
+def render(image_path, width, height, force):
+    """Render one image into the cache, returns (status, cache key, seconds, error)"""
+    start = time.perf_counter()
+    key = None
+    try:
+        key = render_cache.cache_key(image_path, width, height, Image.LANCZOS)
+        if not force and render_cache.entry_path(key):
+            return 'cached', key, time.perf_counter() - start, None
+        render_cache.store(key, prepare_image(image_path, width, height))
+        return 'rendered', key, time.perf_counter() - start, None
+    except Exception as e:
+        return 'failed', key, time.perf_counter() - start, str(e)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-render screen-sized copies of images into the Magic Frame render cache")
+    parser.add_argument('directory', nargs='?', default=IMAGE_DIR, help=f"directory of images (default {IMAGE_DIR})")
+    parser.add_argument('--width', type=int, default=1024, help="screen width")
+    parser.add_argument('--height', type=int, default=600, help="screen height")
+    parser.add_argument('--cache-dir', default=RENDER_CACHE_DIR, help=f"render cache to fill (default {RENDER_CACHE_DIR})")
+    parser.add_argument('--max-mb', type=int, default=RENDER_CACHE_MAX_BYTES // (1024 * 1024),
+                        help="size of the render cache, older entries are evicted beyond it")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="worker processes (default: all cores)")
+    parser.add_argument('--force', action='store_true', help="render again even if a cached copy exists")
+    args = parser.parse_args()
+    if not os.path.isdir(args.directory):
+        parser.error(f"{args.directory} is not a directory")
+
+    image_paths = find_images(args.directory)
+    if not image_paths:
+        print(f"No images found in {args.directory}")
+        return 1
+
+    max_bytes = args.max_mb * 1024 * 1024
+    print(f"Rendering {len(image_paths)} images for {args.width}x{args.height} into {args.cache_dir} "
+          f"with {args.workers} processes")
+    counts = {'rendered': 0, 'cached': 0, 'failed': 0}
+    keys = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker,
+                             initargs=(args.cache_dir, max_bytes)) as executor:
+        renders = {executor.submit(render, image_path, args.width, args.height, args.force): image_path
+                   for image_path in image_paths}
+        for done, future in enumerate(as_completed(renders), 1):
+            status, key, seconds, error = future.result()
+            counts[status] += 1
+            if status != 'failed':
+                keys.append(key)
+            name = os.path.basename(renders[future])
+            if error:
+                print(f"Error rendering {name}: {error}")
+            elif status == 'rendered':
+                print(f"[{done}/{len(image_paths)}] {name}: {seconds * 1000:.0f} ms")
+
+    elapsed = time.perf_counter() - start
+    print(f"{counts['rendered']} rendered, {counts['cached']} already cached, {counts['failed']} failed "
+          f"in {elapsed:.1f}s ({len(image_paths) / elapsed:.1f} images/s)")
+
+    # The workers evict from the cache on their own, check that nothing was lost along the way
+    cache = RenderCache(args.cache_dir, max_bytes)
+    evicted = sum(1 for key in keys if not cache.entry_path(key))
+    if evicted:
+        print(f"The render cache is full, {evicted} copies were evicted again. "
+              f"Raise --max-mb and RENDER_CACHE_MAX_BYTES to keep them all.")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,11 +7,12 @@ DESKTOP_FILE="$AUTOSTART_DIR/magicframe.desktop"
 # Ensure the autostart directory exists
 sudo mkdir -p "$AUTOSTART_DIR"
 
-# Content for the desktop file with git pull included before the loginscript execution
+# Content for the desktop file. The frame starts right away, git pull runs in the
+# background once the network is up and the update is used from the next start on
 DESKTOP_CONTENT="[Desktop Entry]
 Type=Application
 Name=MagicFrame
-Exec=bash -c 'for i in {1..10}; do ping -c1 github.com && break || sleep 1; done; cd /home/kingu/Documents/loginscript/magicframe && git pull || true; /usr/bin/python3 /home/kingu/Documents/loginscript/magicframe/Raspberrypi/loginscript.py'
+Exec=bash -c '(for i in {1..10}; do ping -c1 github.com && break || sleep 1; done; cd /home/kingu/Documents/loginscript/magicframe && git pull || true) & exec /usr/bin/python3 /home/kingu/Documents/loginscript/magicframe/Raspberrypi/loginscript.py'
 "
 
 # Write the content to the desktop file
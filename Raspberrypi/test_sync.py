@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Tests for the resumable, acknowledged sync against a local stand-in server that drops
+connections, answers Range requests and lists wrong hashes.
+
+Run from this directory with:
+    python3 -m unittest test_sync
+"""
+import os
+import re
+import json
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from loginscript import ApiClient, LibraryIndex, PhotoStore, SyncClient, SyncScheduler
+
+
+class FlakyServer(BaseHTTPRequestHandler):
+    """pendingImages, ackImages and /uploads like website/api.php, with configurable faults:
+    ids in cut are cut off mid-body once, ids in refuse_range get one 416 for a Range
+    request and ids in bad_hash are listed with a wrong sha256 once."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        state = self.server.state
+        if '/api.php/pendingImages' in self.path:
+            after = int(re.search(r'after=(\d+)', self.path).group(1))
+            images = []
+            for image_id in sorted(i for i in state['pending'] if i > after)[:2]:
+                digest = hashlib.sha256(state['files'][image_id]).hexdigest()
+                if image_id in state['bad_hash']:
+                    state['bad_hash'].discard(image_id)
+                    digest = '0' * 64
+                images.append({'id': image_id, 'url': f"uploads/{image_id}.jpg", 'original_filename': f"{image_id}.jpg",
+                               'size': len(state['files'][image_id]), 'sha256': digest})
+            return self.send_json({'images': images})
+
+        image_id = int(re.search(r'/uploads/(\d+)\.jpg', self.path).group(1))
+        data = state['files'][image_id]
+        range_header = self.headers.get('Range')
+        state['ranges'].append((image_id, range_header))
+        start = 0
+        if range_header:
+            if image_id in state['refuse_range']:
+                state['refuse_range'].discard(image_id)
+                self.send_response(416)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            start = int(re.search(r'bytes=(\d+)-', range_header).group(1))
+            self.send_response(206)
+            self.send_header('Content-Range', f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+
+        if image_id in state['cut']:
+            # Send part of the body, then drop the connection
+            state['cut'].discard(image_id)
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+    def do_POST(self):
+        ids = json.loads(self.rfile.read(int(self.headers['Content-Length'])))['ids']
+        self.server.state['acked'].extend(ids)
+        self.server.state['pending'].difference_update(ids)
+        self.send_json({'success': True})
+
+
+class SyncClientTest(unittest.TestCase):
+    def setUp(self):
+        # Larger than a few DOWNLOAD_CHUNK_SIZE chunks, partial files keep whole chunks only
+        files = {image_id: os.urandom(300000 + image_id) for image_id in range(1, 6)}
+        self.state = {'files': files, 'pending': set(files), 'acked': [], 'ranges': [],
+                      'cut': set(), 'refuse_range': set(), 'bad_hash': set()}
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyServer)
+        self.server.state = self.state
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.image_dir = os.path.join(self.temp_dir.name, 'images')
+        os.makedirs(self.image_dir)
+        library = LibraryIndex(self.image_dir, os.path.join(self.temp_dir.name, 'library.db'))
+        self.store = PhotoStore(library, self.image_dir)
+        api = ApiClient(lambda: 'token', base_url=f"http://127.0.0.1:{self.server.server_address[1]}")
+        self.client = SyncClient(api, self.store, state_file=os.path.join(self.temp_dir.name, 'sync_state.json'))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def partial_files(self):
+        return sorted(name for name in os.listdir(self.image_dir) if name.startswith('.sync-'))
+
+    def assert_all_received(self):
+        self.assertEqual(sorted(self.state['acked']), sorted(self.state['files']))
+        self.assertEqual(self.partial_files(), [])
+        for data in self.state['files'].values():
+            self.assertIsNotNone(self.store.find(hashlib.sha256(data).hexdigest()))
+
+    def test_dropped_downloads_are_resumed_and_acknowledged(self):
+        self.state['cut'] = set(self.state['files'])
+
+        self.assertEqual(self.client.sync(), [])
+        self.assertEqual(self.partial_files(), [f".sync-{image_id}.part" for image_id in sorted(self.state['files'])])
+        self.assertEqual(self.state['acked'], [])
+        partial_sizes = {image_id: os.path.getsize(os.path.join(self.image_dir, f".sync-{image_id}.part"))
+                         for image_id in self.state['files']}
+        self.assertTrue(all(partial_sizes.values()))
+
+        received = self.client.sync()
+        self.assertEqual(len(received), len(self.state['files']))
+        self.assert_all_received()
+        # The second pass continued where the first one was cut off
+        resumed = [(image_id, header) for image_id, header in self.state['ranges'] if header]
+        self.assertEqual(len(resumed), len(self.state['files']))
+        for image_id, header in resumed:
+            self.assertEqual(header, f"bytes={partial_sizes[image_id]}-")
+
+    def test_refused_range_starts_over(self):
+        self.state['cut'] = {2}
+        self.state['refuse_range'] = {2}
+
+        self.client.sync()
+        self.assertEqual(self.partial_files(), ['.sync-2.part'])
+        self.assertNotIn(2, self.state['acked'])
+
+        # 416 drops the partial file, the next pass downloads the image from the start
+        self.client.sync()
+        self.assertEqual(self.partial_files(), [])
+        self.assertNotIn(2, self.state['acked'])
+        self.client.sync()
+        self.assert_all_received()
+
+    def test_wrong_hash_is_not_acknowledged(self):
+        self.state['bad_hash'] = {4}
+
+        self.client.sync()
+        self.assertNotIn(4, self.state['acked'])
+        self.assertIsNone(self.store.find(hashlib.sha256(self.state['files'][4]).hexdigest()))
+
+        self.client.sync()
+        self.assert_all_received()
+
+
+class CountResponse:
+    def __init__(self, status_code, count=0, etag=None):
+        self.status_code = status_code
+        self.headers = {'ETag': etag} if etag else {}
+        self.count = count
+
+    def json(self):
+        return {'count': self.count}
+
+
+class CountApi:
+    """pendingCount like website/api.php: 304 while If-None-Match matches the current ETag"""
+    def __init__(self, count):
+        self.count = count
+        self.probes = 0
+
+    def get(self, endpoint, headers=None, **kwargs):
+        self.probes += 1
+        etag = f'"{self.count}"'
+        if (headers or {}).get('If-None-Match') == etag:
+            return CountResponse(304)
+        return CountResponse(200, self.count, etag)
+
+
+class SyncSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.api = CountApi(3)
+        self.scheduler = SyncScheduler(self.api, quiet_hours=None, hourly_byte_cap=None)
+
+    def test_unchanged_count_skips_the_sync(self):
+        self.assertFalse(self.scheduler.nothing_new())
+        self.scheduler.record(3, 1000)
+        self.api.count = 0
+        self.assertTrue(self.scheduler.nothing_new())
+        self.scheduler.record(0, 0)
+        # Answered with a 304 this time
+        self.assertTrue(self.scheduler.nothing_new())
+        self.assertEqual(self.api.probes, 3)
+
+    def test_incomplete_sync_is_retried_despite_304(self):
+        self.assertFalse(self.scheduler.nothing_new())
+        # Only one of the three images came through, the count and its ETag stay the same
+        self.scheduler.record(1, 1000)
+        self.assertFalse(self.scheduler.nothing_new())
+        self.assertEqual(self.api.probes, 1)
+        self.scheduler.record(2, 2000)
+        self.api.count = 0
+        self.assertTrue(self.scheduler.nothing_new())
+
+    def test_failed_sync_is_retried_despite_304(self):
+        self.api.count = 0
+        self.assertTrue(self.scheduler.nothing_new())
+        self.scheduler.record(0, 0, failed=True)
+        self.assertFalse(self.scheduler.nothing_new())
+        self.scheduler.record(0, 0)
+        self.assertTrue(self.scheduler.nothing_new())
+
+
+if __name__ == "__main__":
+    unittest.main()
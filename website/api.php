@@ -64,6 +64,142 @@ function authenticate() {
     return $user;
 }
 
+// Seconds of rendition work a single pendingImages page may take before it is cut short
+define('RENDITION_TIME_BUDGET', 10);
+
+// Return the path of a pre-scaled, pre-oriented copy of an image for the display geometry
+// given in the width/height/format query parameters, creating it on first use.
+// Falls back to the original when no size was requested, GD is missing, the file cannot be read
+// or decoding it would not fit into memory_limit.
+function renditionPath($filePath) {
+    $width = isset($_GET['width']) ? min(4096, intval($_GET['width'])) : 0;
+    $height = isset($_GET['height']) ? min(4096, intval($_GET['height'])) : 0;
+    if ($width <= 0 || $height <= 0 || !function_exists('imagecreatetruecolor')) {
+        return $filePath;
+    }
+    
+    $format = isset($_GET['format']) && in_array($_GET['format'], ['jpeg', 'png', 'webp']) ? $_GET['format'] : 'jpeg';
+    if ($format === 'webp' && !function_exists('imagewebp')) {
+        $format = 'jpeg';
+    }
+    $extension = $format === 'jpeg' ? 'jpg' : $format;
+    
+    // Renditions are cached next to the uploads, keyed by source file, its mtime and the geometry
+    $renditionDir = __DIR__ . '/uploads/renditions';
+    if (!file_exists($renditionDir)) {
+        mkdir($renditionDir, 0755, true);
+    }
+    $key = sha1($filePath . '|' . filemtime($filePath) . '|' . $width . 'x' . $height);
+    $renditionFile = $renditionDir . '/' . $key . '.' . $extension;
+    if (file_exists($renditionFile)) {
+        return $renditionFile;
+    }
+    
+    $info = @getimagesize($filePath);
+    if (!$info) {
+        return $filePath;
+    }
+    $orientation = 1;
+    if ($info[2] === IMAGETYPE_JPEG && function_exists('exif_read_data')) {
+        $exif = @exif_read_data($filePath);
+        $orientation = $exif['Orientation'] ?? 1;
+    }
+    $angles = [3 => 180, 5 => 90, 6 => 270, 7 => 270, 8 => 90];
+    
+    // GD keeps about 5 bytes per pixel and rotating holds a second copy. Running out of
+    // memory is a fatal error that no fallback can catch, so large images are served as originals.
+    $copies = isset($angles[$orientation]) ? 2 : 1;
+    $needed = $info[0] * $info[1] * 5 * $copies + $width * $height * 5;
+    $available = memoryAvailable();
+    if ($available !== null && $needed > $available) {
+        return $filePath;
+    }
+    
+    switch ($info[2]) {
+        case IMAGETYPE_JPEG:
+            $source = @imagecreatefromjpeg($filePath);
+            break;
+        case IMAGETYPE_PNG:
+            $source = @imagecreatefrompng($filePath);
+            break;
+        case IMAGETYPE_GIF:
+            $source = @imagecreatefromgif($filePath);
+            break;
+        default:
+            return $filePath;
+    }
+    if (!$source) {
+        return $filePath;
+    }
+    
+    // Apply the EXIF orientation here so the frame does not have to
+    if (in_array($orientation, [2, 4, 5, 7])) {
+        imageflip($source, $orientation === 4 ? IMG_FLIP_VERTICAL : IMG_FLIP_HORIZONTAL);
+    }
+    if (isset($angles[$orientation])) {
+        $rotated = imagerotate($source, $angles[$orientation], 0);
+        imagedestroy($source);
+        $source = $rotated;
+    }
+    
+    // Fit inside the requested box, never upscale
+    $sourceWidth = imagesx($source);
+    $sourceHeight = imagesy($source);
+    $scale = min($width / $sourceWidth, $height / $sourceHeight, 1);
+    $targetWidth = max(1, (int)round($sourceWidth * $scale));
+    $targetHeight = max(1, (int)round($sourceHeight * $scale));
+    
+    $target = imagecreatetruecolor($targetWidth, $targetHeight);
+    if ($format !== 'jpeg') {
+        imagealphablending($target, false);
+        imagesavealpha($target, true);
+    }
+    imagecopyresampled($target, $source, 0, 0, 0, 0, $targetWidth, $targetHeight, $sourceWidth, $sourceHeight);
+    
+    // Write to a temporary name so concurrent requests never serve a partial file
+    $tempFile = $renditionFile . '.' . getmypid() . '.tmp';
+    if ($format === 'png') {
+        $saved = imagepng($target, $tempFile);
+    } else if ($format === 'webp') {
+        $saved = imagewebp($target, $tempFile, 85);
+    } else {
+        $saved = imagejpeg($target, $tempFile, 85);
+    }
+    imagedestroy($source);
+    imagedestroy($target);
+    
+    if (!$saved || !rename($tempFile, $renditionFile)) {
+        @unlink($tempFile);
+        return $filePath;
+    }
+    return $renditionFile;
+}
+
+// Bytes this request may still allocate before hitting memory_limit, null when unlimited
+function memoryAvailable() {
+    $limit = trim(ini_get('memory_limit'));
+    if ($limit === '' || $limit === '-1') {
+        return null;
+    }
+    $bytes = intval($limit);
+    switch (strtolower(substr($limit, -1))) {
+        case 'g':
+            $bytes *= 1024;
+            // Fall through
+        case 'm':
+            $bytes *= 1024;
+            // Fall through
+        case 'k':
+            $bytes *= 1024;
+    }
+    return $bytes - memory_get_usage();
+}
+
+// Download name for a file that may have been replaced by a rendition in another format
+function renditionName($name, $path) {
+    return pathinfo($name, PATHINFO_FILENAME) . '.' . pathinfo($path, PATHINFO_EXTENSION);
+}
+
 // Login endpoint
 function login() {
     global $db;
@@ -251,10 +387,11 @@ function getNotDownloadedImages() {
         if ($downloadMode) {
             $filePath = __DIR__ . '/uploads/' . $image['user_id'] . '/' . $image['filename'];
             if (file_exists($filePath)) {
+                $filePath = renditionPath($filePath);
                 $imagesToZip[] = [
                     'id' => $image['id'],
                     'path' => $filePath,
-                    'name' => $image['original_filename'] ?? $image['filename']
+                    'name' => renditionName($image['original_filename'] ?? $image['filename'], $filePath)
                 ];
             }
         }
@@ -383,6 +520,170 @@ function getNotDownloadedImagesMeta() {
     echo json_encode(['images' => $images]);
 }
 
+// List images waiting for this frame without marking them as downloaded.
+// Clients page through with ?after=<last id>&limit=<n> and confirm receipt via ackImages.
+function getPendingImages() {
+    global $db;
+    
+    $user = authenticate();
+    $userId = $user['id'];
+    
+    $after = isset($_GET['after']) ? intval($_GET['after']) : 0;
+    $limit = isset($_GET['limit']) ? max(1, min(500, intval($_GET['limit']))) : 100;
+    
+    $stmt = $db->prepare('
+        SELECT i.id, i.user_id, i.filename, i.original_filename, i.upload_date, u.username as uploaded_by
+        FROM images i
+        JOIN image_permissions p ON i.id = p.image_id
+        JOIN users u ON i.user_id = u.id
+        WHERE p.user_id = :user_id
+        AND p.downloaded = 0
+        AND i.id > :after
+        ORDER BY i.id ASC
+        LIMIT :limit
+    ');
+    $stmt->bindValue(':user_id', $userId, SQLITE3_INTEGER);
+    $stmt->bindValue(':after', $after, SQLITE3_INTEGER);
+    $stmt->bindValue(':limit', $limit, SQLITE3_INTEGER);
+    $result = $stmt->execute();
+    
+    // Renditions are created on first listing. Once that has taken a while the page ends early,
+    // the client asks again after the last listed id, so no request runs into max_execution_time.
+    $started = microtime(true);
+    $images = [];
+    while ($image = $result->fetchArray(SQLITE3_ASSOC)) {
+        if ($images && microtime(true) - $started > RENDITION_TIME_BUDGET) {
+            break;
+        }
+        $filePath = __DIR__ . '/uploads/' . $image['user_id'] . '/' . $image['filename'];
+        if (!file_exists($filePath)) {
+            continue;
+        }
+        
+        // Serve a rendition for the frame's display if it asked for one
+        $image['original_url'] = 'uploads/' . $image['user_id'] . '/' . $image['filename'];
+        $image['url'] = $image['original_url'];
+        $image['rendition'] = false;
+        $servedPath = renditionPath($filePath);
+        if ($servedPath !== $filePath) {
+            $image['url'] = 'uploads/renditions/' . basename($servedPath);
+            $image['rendition'] = true;
+        }
+        
+        // Size and hash let the client verify the file before acknowledging it
+        $image['size'] = filesize($servedPath);
+        $image['sha256'] = hash_file('sha256', $servedPath);
+        $images[] = $image;
+    }
+    
+    echo json_encode(['images' => $images]);
+}
+
+// Cheap "anything new?" probe for frames. Answers 304 when the ETag sent in
+// If-None-Match still matches, so idle frames only cost a header exchange.
+function getPendingCount() {
+    global $db;
+    
+    $user = authenticate();
+    $userId = $user['id'];
+    
+    $stmt = $db->prepare('
+        SELECT COUNT(*) as count, MAX(image_id) as latest
+        FROM image_permissions
+        WHERE user_id = :user_id AND downloaded = 0
+    ');
+    $stmt->bindValue(':user_id', $userId, SQLITE3_INTEGER);
+    $result = $stmt->execute()->fetchArray(SQLITE3_ASSOC);
+    
+    $etag = '"' . md5($userId . '|' . $result['count'] . '|' . $result['latest']) . '"';
+    header('ETag: ' . $etag);
+    header('Cache-Control: no-cache');
+    
+    if (isset($_SERVER['HTTP_IF_NONE_MATCH']) && trim($_SERVER['HTTP_IF_NONE_MATCH']) === $etag) {
+        http_response_code(304);
+        return;
+    }
+    
+    echo json_encode(['count' => $result['count']]);
+}
+
+// Long-poll for new shares. Holds the request open until an image shared after the
+// share marker `since` is waiting for this user or `timeout` seconds have passed.
+// The marker is the rowid of the newest pending permission, which only grows.
+function waitForImages() {
+    global $db;
+    
+    $user = authenticate();
+    $userId = $user['id'];
+    
+    // Release the session lock so the user's other requests are not blocked while we wait
+    session_write_close();
+    
+    $since = isset($_GET['since']) ? intval($_GET['since']) : 0;
+    $timeout = isset($_GET['timeout']) ? max(1, min(60, intval($_GET['timeout']))) : 25;
+    set_time_limit($timeout + 10);
+    
+    $stmt = $db->prepare('
+        SELECT COUNT(*) as count, MAX(rowid) as latest
+        FROM image_permissions
+        WHERE user_id = :user_id AND downloaded = 0
+    ');
+    $stmt->bindValue(':user_id', $userId, SQLITE3_INTEGER);
+    
+    $deadline = time() + $timeout;
+    while (true) {
+        $result = $stmt->execute()->fetchArray(SQLITE3_ASSOC);
+        $stmt->reset();
+        $latest = intval($result['latest']);
+        
+        if ($result['count'] > 0 && $latest > $since) {
+            echo json_encode(['changed' => true, 'count' => $result['count'], 'latest' => $latest]);
+            return;
+        }
+        if (time() >= $deadline) {
+            break;
+        }
+        sleep(1);
+    }
+    
+    echo json_encode(['changed' => false, 'count' => $result['count'], 'latest' => max($since, $latest)]);
+}
+
+// Mark images as received by this frame
+function ackImages() {
+    global $db;
+    
+    $user = authenticate();
+    $userId = $user['id'];
+    
+    $data = json_decode(file_get_contents('php://input'), true);
+    if (!isset($data['ids']) || !is_array($data['ids'])) {
+        http_response_code(400);
+        echo json_encode(['error' => 'An "ids" array is required']);
+        return;
+    }
+    
+    $acknowledged = 0;
+    $db->exec('BEGIN');
+    foreach (array_map('intval', $data['ids']) as $imageId) {
+        $stmt = $db->prepare('
+            UPDATE image_permissions
+            SET downloaded = 1
+            WHERE image_id = :image_id AND user_id = :user_id
+        ');
+        $stmt->bindValue(':image_id', $imageId, SQLITE3_INTEGER);
+        $stmt->bindValue(':user_id', $userId, SQLITE3_INTEGER);
+        $stmt->execute();
+        $acknowledged += $db->changes();
+    }
+    $db->exec('COMMIT');
+    
+    echo json_encode([
+        'success' => true,
+        'acknowledged' => $acknowledged
+    ]);
+}
+
 // Upload a new image
 function uploadImage() {
     global $db;
@@ -627,11 +928,12 @@ function downloadImages() {
             $filePath = __DIR__ . '/uploads/' . $image['user_id'] . '/' . $image['filename'];
             
             if (file_exists($filePath)) {
+                $filePath = renditionPath($filePath);
                 $imagesToZip[] = [
                     'id' => $image['id'],
                     'owner_id' => $image['owner_id'],
                     'path' => $filePath,
-                    'name' => $image['orig_name'] // Use original filename for the ZIP
+                    'name' => renditionName($image['orig_name'], $filePath) // Use original filename for the ZIP
                 ];
                 
                 // Update download status if it's a shared image
@@ -743,11 +1045,12 @@ function downloadSingleImage($imageId, $userId, $db) {
         echo json_encode(['error' => 'Image file not found']);
         return;
     }
+    $filePath = renditionPath($filePath);
     
     // Set appropriate headers for file download
     header('Content-Type: application/json'); // Remove this line
     header('Content-Type: ' . mime_content_type($filePath));
-    header('Content-Disposition: attachment; filename="' . $image['original_filename'] . '"');
+    header('Content-Disposition: attachment; filename="' . renditionName($image['original_filename'], $filePath) . '"');
     header('Content-Length: ' . filesize($filePath));
     header('Cache-Control: no-cache, must-revalidate');
     header('Pragma: public');
@@ -813,6 +1116,38 @@ switch ($endpoint) {
             echo json_encode(['error' => 'Method not allowed']);
         }
         break;
+    case 'pendingImages':
+        if ($requestMethod === 'GET') {
+            getPendingImages();
+        } else {
+            http_response_code(405);
+            echo json_encode(['error' => 'Method not allowed']);
+        }
+        break;
+    case 'waitForImages':
+        if ($requestMethod === 'GET') {
+            waitForImages();
+        } else {
+            http_response_code(405);
+            echo json_encode(['error' => 'Method not allowed']);
+        }
+        break;
+    case 'pendingCount':
+        if ($requestMethod === 'GET') {
+            getPendingCount();
+        } else {
+            http_response_code(405);
+            echo json_encode(['error' => 'Method not allowed']);
+        }
+        break;
+    case 'ackImages':
+        if ($requestMethod === 'POST') {
+            ackImages();
+        } else {
+            http_response_code(405);
+            echo json_encode(['error' => 'Method not allowed']);
+        }
+        break;
     
     case 'friends':
         if ($requestMethod === 'GET') {